@@ -8,5 +8,9 @@ __author__ = "Lenz Furrer"
 __version__ = '1.2.1'
 
 
-from .fmt import load, loads, fetch, dump, dumps, LOADERS, FETCHERS, EXPORTERS
-from .doc.document import Collection, Document, Entity, Relation
+from .fmt import load, loads, load_dir, fetch, dump, dumps, dump_many
+from .fmt import convert, convert_dir, index
+from .fmt import LOADERS, FETCHERS, EXPORTERS
+from .doc.document import Collection, LazyCollection, IndexedCollection
+from .doc.document import Document
+from .doc.document import Entity, Relation
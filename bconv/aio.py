@@ -0,0 +1,138 @@
+"""
+Asyncio interface for loading, fetching and dumping.
+
+The blocking work (file and network I/O, parsing and
+serialising) runs in an executor, so the event loop
+stays responsive:
+
+    async for doc in aload('path/to/example.xml', 'bioc_xml'):
+        ...
+    docs = afetch(pmids, 'pubmed', workers=3)
+    await adump(docs, 'path/to/example.conll', 'conll')
+
+By default, the loop's default executor (a thread pool) is
+used; pass a concurrent.futures.ThreadPoolExecutor to limit
+the number of concurrent jobs. For parsing on multiple CPUs,
+combine this with the `workers` option of the loaders that
+support it (eg. PubTator, CoNLL, BioC XML).
+"""
+
+
+__author__ = "Lenz Furrer"
+
+__all__ = ['aload', 'afetch', 'adump']
+
+
+import asyncio
+import threading
+import functools
+import itertools as it
+from concurrent import futures
+
+from .fmt import load, fetch, dump
+
+
+def aload(source, fmt=None, executor=None, ahead=16, **options):
+    """
+    Iterate asynchronously over the documents of a file.
+
+    The documents are loaded lazily in `executor`, in batches
+    of up to `ahead` documents. Any options are passed to the
+    loader (see bconv.load()).
+    """
+    job = functools.partial(load, source, fmt, mode='lazy', **options)
+    return _aiter(job, executor, ahead)
+
+
+def afetch(query, fmt, executor=None, ahead=16, **options):
+    """
+    Iterate asynchronously over documents from a remote service.
+
+    The fetcher runs in `executor`, from where it requests
+    concurrent batches (see the fetcher options `batch_size`,
+    `workers` and `rate`). Any options are passed to the
+    fetcher (see bconv.fetch()).
+    """
+    job = functools.partial(fetch, query, fmt, mode='lazy', **options)
+    return _aiter(job, executor, ahead)
+
+
+async def adump(content, dest, fmt=None, executor=None, **options):
+    """
+    Serialise documents to a file.
+
+    The content can be a Document, a Collection, or an
+    iterable or async iterable of Documents (eg. from
+    aload()), which is consumed lazily.
+    The formatter runs in `executor`, except for async
+    iterables: since these may need the same executor to
+    produce their documents, the formatter gets a thread
+    of its own. Any options are passed to bconv.dump().
+    """
+    loop = asyncio.get_running_loop()
+    if hasattr(content, '__aiter__'):
+        job = functools.partial(dump, _sync_iter(content, loop), dest, fmt,
+                                **options)
+        await _run_in_thread(job)
+    else:
+        job = functools.partial(dump, content, dest, fmt, **options)
+        await loop.run_in_executor(executor, job)
+
+
+async def _aiter(job, executor, ahead):
+    loop = asyncio.get_running_loop()
+    docs = await loop.run_in_executor(executor, job)
+    pending = None
+    try:
+        while True:
+            pending = loop.run_in_executor(executor, _next_batch, docs, ahead)
+            batch = await pending
+            if not batch:
+                break
+            for doc in batch:
+                yield doc
+    finally:
+        close = getattr(docs, 'close', None)
+        if close is not None:
+            if pending is not None and not pending.done():
+                # Cancelled: the generator is still running in the executor.
+                pending.add_done_callback(lambda _: close())
+            else:
+                await loop.run_in_executor(executor, close)
+
+
+def _next_batch(iterator, size):
+    return list(it.islice(iterator, size))
+
+
+def _run_in_thread(job):
+    """Run a blocking job in a new thread; return an awaitable."""
+    future = futures.Future()
+
+    def _run():
+        try:
+            future.set_result(job())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=_run, daemon=True).start()
+    return asyncio.wrap_future(future)
+
+
+def _sync_iter(aiterable, loop):
+    """Iterate over an async iterable from outside the event loop."""
+    aiterator = aiterable.__aiter__()
+    end = object()
+    while True:
+        future = asyncio.run_coroutine_threadsafe(_anext(aiterator, end), loop)
+        item = future.result()
+        if item is end:
+            return
+        yield item
+
+
+async def _anext(aiterator, default):
+    try:
+        return await aiterator.__anext__()
+    except StopAsyncIteration:
+        return default
@@ -28,7 +28,7 @@ __author__ = "Lenz Furrer"
 import re
 import logging
 from collections import namedtuple
-from collections.abc import Sized
+from collections.abc import Sized, Sequence
 
 from ..util.iterate import peek
 from ..nlp.tokenize import TOKENIZER
@@ -666,6 +666,94 @@ class Collection(Exportable):
     add_entities = None
 
 
+class LazyCollection(Collection):
+    """
+    A collection backed by an iterable of documents.
+
+    The documents are consumed on demand and not kept in
+    memory, so they can be iterated over only once.
+    """
+
+    def __init__(self, documents, id=None, filename=None, **metadata):
+        super().__init__(id, filename, **metadata)
+        self._children = iter(documents)
+
+    def __repr__(self):
+        return '<{} (single-pass) at {}>'.format(self.__class__.__name__,
+                                                 hex(id(self)))
+
+    def __bool__(self):
+        # The number of documents is unknown, but the collection exists.
+        return True
+
+    def __len__(self):
+        raise TypeError('a LazyCollection is unsized (single-pass)')
+
+    def __getitem__(self, index):
+        raise TypeError('a LazyCollection is single-pass and cannot be '
+                        'indexed; iterate over it instead')
+
+    def add_document(self, document):
+        raise TypeError('cannot add documents to a LazyCollection')
+
+    def get_document(self, id):
+        raise TypeError('cannot access documents of a LazyCollection by ID')
+
+
+class IndexedCollection(Collection):
+    """
+    A collection with random access to documents on disk.
+
+    The documents are loaded on demand through the callable
+    `load_documents`, which takes a list of document IDs and
+    returns an iterable of the corresponding documents (eg.
+    from a file index, see bconv.index()).
+    They aren't kept in memory, so each access loads them
+    anew.
+    """
+
+    def __init__(self, ids, load_documents, id=None, filename=None,
+                 **metadata):
+        super().__init__(id, filename, **metadata)
+        self._children = _LoadedDocuments(list(ids), load_documents)
+        self._by_ids = None
+
+    @property
+    def ids(self):
+        """IDs of all documents."""
+        return self._children.ids
+
+    def add_document(self, document):
+        raise TypeError('cannot add documents to an IndexedCollection')
+
+    def get_document(self, id):
+        """
+        Load a document by its ID.
+        """
+        for doc in self._children.load([id]):
+            return doc
+        raise KeyError(id)
+
+
+class _LoadedDocuments(Sequence):
+    """Sequence of documents loaded on demand."""
+
+    def __init__(self, ids, load):
+        self.ids = ids
+        self.load = load
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self.load(self.ids[index]))
+        return next(iter(self.load([self.ids[index]])))
+
+    def __iter__(self):
+        return iter(self.load(self.ids))
+
+
 class Entity:
     """
     Link from textual evidence to an annotated entity.
@@ -7,62 +7,64 @@ __author__ = "Lenz Furrer"
 
 
 import io
+import os
+import functools
 from pathlib import Path
 
-from . import txt
-from . import csv_
-from . import bioc
-from . import brat
-from . import conll
-from . import pubmed
-from . import pubanno
-from . import pubtator
-from . import europepmc
-from ._load import wrap_in_collection
+from ._load import wrap_in_collection, _gc_paused
+from ..doc.document import Collection, LazyCollection, IndexedCollection
+from ._registry import FormatRegistry
+from ._convert import convert, convert_dir, ConversionStats, _prepare
+from ..util.stream import strip_compression_suffix, compress, read_ahead
+from ..util.stream import basename, atomic_wopen, local_path, PATHLIKE
+from ..util.iterate import bounded_map, fan_out
 
 
 # Keep these mappings up to date.
-LOADERS = {
-    'txt': txt.TXTLoader,
-    'txt.json': txt.TXTJSONLoader,
-    'bioc_xml': bioc.BioCXMLLoader,
-    'bioc_json': bioc.BioCJSONLoader,
-    'conll': conll.CoNLLLoader,
-    'pubanno_json': pubanno.PubAnnoJSONLoader,
-    'pubanno_json.tgz': pubanno.PubAnnoTGZLoader,
-    'pubtator': pubtator.PubTatorLoader,
-    'pubtator_fbk': pubtator.PubTatorFBKLoader,
-    'pxml': pubmed.PXMLLoader,
-    'nxml': pubmed.PMCLoader,
-}
-
-FETCHERS = {
-    'pubmed': pubmed.PXMLFetcher,
-    'pmc': pubmed.PMCFetcher,
-}
-
-EXPORTERS = {
-    'txt': txt.TXTFormatter,
-    'txt.json': txt.TXTJSONFormatter,
-    'csv': csv_.CSVFormatter,
-    'tsv': csv_.TSVFormatter,
-    'text_csv': csv_.TextCSVFormatter,
-    'text_tsv': csv_.TextTSVFormatter,
-    'bioc_xml': bioc.BioCXMLFormatter,
-    'bioc_json': bioc.BioCJSONFormatter,
-    'bionlp': brat.BioNLPFormatter,
-    'brat': brat.BratFormatter,
-    'conll': conll.CoNLLFormatter,
-    'pubanno_json': pubanno.PubAnnoJSONFormatter,
-    'pubanno_json.tgz': pubanno.PubAnnoTGZFormatter,
-    'pubtator': pubtator.PubTatorFormatter,
-    'pubtator_fbk': pubtator.PubTatorFBKFormatter,
-    'europepmc': europepmc.EuPMCFormatter,
-    'europepmc.zip': europepmc.EuPMCZipFormatter,
-}
-
-
-def load(source, fmt=None, mode='native', id=None, **options):
+# The format modules are imported on first lookup.
+LOADERS = FormatRegistry('bconv.loaders', {
+    'txt': '.txt:TXTLoader',
+    'txt.json': '.txt:TXTJSONLoader',
+    'bioc_xml': '.bioc:BioCXMLLoader',
+    'bioc_json': '.bioc:BioCJSONLoader',
+    'conll': '.conll:CoNLLLoader',
+    'pubanno_json': '.pubanno:PubAnnoJSONLoader',
+    'pubanno_json.tgz': '.pubanno:PubAnnoTGZLoader',
+    'pubtator': '.pubtator:PubTatorLoader',
+    'pubtator_fbk': '.pubtator:PubTatorFBKLoader',
+    'pxml': '.pubmed:PXMLLoader',
+    'nxml': '.pubmed:PMCLoader',
+})
+
+FETCHERS = FormatRegistry('bconv.fetchers', {
+    'pubmed': '.pubmed:PXMLFetcher',
+    'pmc': '.pubmed:PMCFetcher',
+    'pubtator': '.pubtator_central:PubTatorFetcher',
+})
+
+EXPORTERS = FormatRegistry('bconv.exporters', {
+    'txt': '.txt:TXTFormatter',
+    'txt.json': '.txt:TXTJSONFormatter',
+    'csv': '.csv_:CSVFormatter',
+    'tsv': '.csv_:TSVFormatter',
+    'text_csv': '.csv_:TextCSVFormatter',
+    'text_tsv': '.csv_:TextTSVFormatter',
+    'bioc_xml': '.bioc:BioCXMLFormatter',
+    'bioc_json': '.bioc:BioCJSONFormatter',
+    'bionlp': '.brat:BioNLPFormatter',
+    'brat': '.brat:BratFormatter',
+    'conll': '.conll:CoNLLFormatter',
+    'pubanno_json': '.pubanno:PubAnnoJSONFormatter',
+    'pubanno_json.tgz': '.pubanno:PubAnnoTGZFormatter',
+    'pubtator': '.pubtator:PubTatorFormatter',
+    'pubtator_fbk': '.pubtator:PubTatorFBKFormatter',
+    'europepmc': '.europepmc:EuPMCFormatter',
+    'europepmc.zip': '.europepmc:EuPMCZipFormatter',
+})
+
+
+def load(source, fmt=None, mode='native', id=None, readahead=None,
+         cache=None, ids=None, **options):
     """
     Load a document or collection from a file.
 
@@ -71,14 +73,170 @@ def load(source, fmt=None, mode='native', id=None, **options):
             on the format;
         - collection: a Collection object wrapping all content;
         - lazy: an iterator of Document objects, consumed
-            lazily if possible.
+            lazily if possible;
+        - indexed: an IndexedCollection, which loads documents
+            only when accessed (see index()).
+
+    If `ids` is given, only the documents with these IDs are
+    loaded, using the file's index (see index()).
+
+    If readahead is True or a positive int, the input is
+    read (and decompressed) in a background thread, which
+    buffers up to this many chunks of 256 KiB (default: 16).
+
+    If `cache` is given (a directory or a DiskCache object),
+    the parsed content of local files is stored in pickled
+    form, keyed by the file's content hash, the loader and
+    its options; unchanged files are loaded from the cache.
+    Use DiskCache's options for eviction by age and size,
+    and its counters for hit/miss statistics.
+    With a cache, lazy mode keeps all documents of a file
+    in memory. Only use cache directories you trust, since
+    unpickling can execute arbitrary code.
     """
     if fmt is None:
         fmt = _guess_format(source, LOADERS)
     loader = LOADERS[fmt](**options)
+    if ids is not None or mode == 'indexed':
+        return _load_indexed(loader, fmt, mode, source, id, ids)
+    if cache is not None:
+        key = _cache_key(loader, source, mode, id, options)
+        if key is not None:
+            return _load_cached(loader, mode, source, id, readahead,
+                                cache, key)
+    return _load_fresh(loader, mode, source, id, readahead)
+
+
+def _load_fresh(loader, mode, source, id, readahead):
+    if readahead and not isinstance(source, io.TextIOBase):
+        depth = 16 if readahead is True else readahead
+        source = read_ahead(source, depth=depth)
     return _load(loader, mode, source, id)
 
 
+def _load_cached(loader, mode, source, id, readahead, cache, key):
+    import pickle
+    from ..util.cache import DiskCache
+    if not isinstance(cache, DiskCache):
+        cache = DiskCache(cache)
+    data = cache.get(key)
+    if data is not None:
+        with _gc_paused():
+            content = pickle.loads(data)
+    else:
+        content = _load_fresh(loader, mode, source, id, readahead)
+        if mode == 'lazy':
+            content = list(content)
+        cache.put(key, pickle.dumps(content, pickle.HIGHEST_PROTOCOL))
+    return iter(content) if mode == 'lazy' else content
+
+
+def _cache_key(loader, source, mode, id, options):
+    """Key for the parse cache, or None if the source isn't a file."""
+    if not isinstance(source, (str, PATHLIKE)) or not os.path.isfile(source):
+        return None
+    import json
+    import hashlib
+    from .. import __version__
+    from ..util.manifest import file_checksum
+    cls = type(loader)
+    options = {k: v for k, v in options.items() if k not in _UNCACHED_OPTIONS}
+    # The loaders derive IDs and filenames from the base name.
+    params = json.dumps([__version__, mode, id, basename(source), options],
+                        sort_keys=True, default=repr)
+    params = hashlib.sha256(params.encode('utf8')).hexdigest()
+    return '{}.{}/{}-{}'.format(cls.__module__, cls.__qualname__,
+                                file_checksum(source), params[:16])
+
+
+# Loader options which don't affect the parse result
+# (like load()'s own `readahead`).
+_UNCACHED_OPTIONS = frozenset(['workers', 'chunk_size', 'mmap'])
+
+
+def index(path, fmt=None):
+    """
+    Build an index for random access to the documents of a file.
+
+    The index maps document IDs to byte offsets and lengths;
+    it is stored as "<path>.bconv-index" in JSON lines.
+    Indexing is supported for local uncompressed files in
+    these formats: pubtator, pubtator_fbk, conll, bioc_xml.
+
+    load() with `ids` or mode="indexed" uses the index, and
+    (re-)builds it if it is missing or outdated.
+    Return the path of the index file.
+    """
+    import json
+    if fmt is None:
+        fmt = _guess_format(path, LOADERS)
+    loader = LOADERS[fmt]()
+    _check_indexable(loader, fmt, path)
+    dest = _index_path(path)
+    with atomic_wopen(dest) as f:
+        f.write(json.dumps(_index_header(path, fmt)) + '\n')
+        for entry in loader.iter_index(str(path)):
+            f.write(json.dumps(entry) + '\n')
+    return dest
+
+
+def _load_indexed(loader, fmt, mode, source, id, ids):
+    _check_indexable(loader, fmt, source)
+    path = str(source)
+    offsets = _read_index(path, fmt)
+    if offsets is None:
+        index(path, fmt)
+        offsets = _read_index(path, fmt)
+
+    def _load_documents(docids):
+        try:
+            spans = [offsets[docid] for docid in docids]
+        except KeyError as e:
+            raise KeyError('document ID not found: {}'.format(e)) from None
+        return loader.iter_spans(path, spans)
+
+    if mode == 'indexed':
+        return IndexedCollection(offsets if ids is None else ids,
+                                 _load_documents, id, basename(path))
+    docs = _load_documents(ids)
+    if mode == 'lazy':
+        return docs
+    return Collection.from_iterable(docs, id, basename(path))
+
+
+def _check_indexable(loader, fmt, source):
+    if getattr(loader, '_docid', None) is None:
+        raise ValueError('random access is not supported for {}'.format(fmt))
+    if local_path(source) is None:
+        raise ValueError('random access requires a local uncompressed file')
+
+
+def _index_path(path):
+    return Path('{}.bconv-index'.format(path))
+
+
+def _index_header(path, fmt):
+    st = os.stat(str(path))
+    return {'fmt': fmt, 'size': st.st_size, 'mtime': st.st_mtime_ns}
+
+
+def _read_index(path, fmt):
+    """Read an index into a dict, or return None if missing or outdated."""
+    import json
+    try:
+        f = open(str(_index_path(path)), encoding='utf8')
+    except FileNotFoundError:
+        return None
+    with f:
+        if json.loads(next(f, 'null')) != _index_header(path, fmt):
+            return None
+        offsets = {}
+        for line in f:
+            docid, offset, length = json.loads(line)
+            offsets.setdefault(docid, (offset, length))
+    return offsets
+
+
 def _load(loader, mode, source, id):
     if mode == 'lazy' and hasattr(loader, 'iter_documents'):
         content = loader.iter_documents(source)
@@ -94,6 +252,75 @@ def _load(loader, mode, source, id):
     return content
 
 
+def load_dir(path, fmt=None, pattern='*', processes=None, ordered=True,
+             ahead=None, chunksize=1, **options):
+    """
+    Iterate over the documents of all files in a directory.
+
+    The files matching the glob `pattern` (eg. "*.xml",
+    or "**/*.xml" for recursion) are parsed in parallel
+    in `processes` worker processes (default: the number
+    of CPUs; use 0 for parsing in the calling process).
+    If fmt is None, it is inferred for each file.
+
+    If `ordered` is True, the documents are yielded in the
+    order of the sorted file paths; otherwise, in the order
+    in which the files are completed.
+    Each worker task covers `chunksize` files; for many
+    small files, larger chunks reduce the overhead of
+    inter-process communication.
+    At most `ahead` tasks (default: twice the number of
+    processes) are processed in advance, which keeps memory
+    bounded when the documents are consumed slowly.
+
+    Any options are passed on to the loader (including its
+    own `workers` option, where supported).
+    """
+    paths = _input_files(Path(path), pattern)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if not processes:
+        for p in paths:
+            yield from _iter_file(p, fmt, options)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    chunks = [paths[i:i+chunksize] for i in range(0, len(paths), chunksize)]
+    job = functools.partial(_load_files, fmt=fmt, options=options)
+    with ProcessPoolExecutor(processes) as executor:
+        for docs in bounded_map(executor, job, chunks,
+                                ahead=ahead or 2*processes, ordered=ordered):
+            yield from docs
+
+
+def _input_files(directory, pattern):
+    """
+    Sorted list of files matching `pattern` in `directory`.
+
+    Hidden files (including temporary files left over by
+    atomic_wopen()) and index files are skipped.
+    """
+    paths = []
+    for path in directory.glob(pattern):
+        parts = path.relative_to(directory).parts
+        if (path.is_file() and not path.name.endswith('.bconv-index')
+                and not any(p.startswith('.') for p in parts)):
+            paths.append(path)
+    return sorted(paths)
+
+
+def _load_files(paths, fmt, options):
+    return [doc for p in paths for doc in _iter_file(p, fmt, options)]
+
+
+def _iter_file(path, fmt, options):
+    if fmt is None:
+        fmt = _guess_format(path, LOADERS)
+    for doc in load(path, fmt, mode='lazy', **options):
+        if doc.filename is None:
+            doc.filename = basename(path)
+        yield doc
+
+
 def loads(source, fmt, mode='native', id=None, **options):
     """
     Load a document or collection from str or bytes.
@@ -110,20 +337,105 @@ def fetch(query, fmt, mode='native', id=None, **options):
     return _load(fetcher, mode, query, id)
 
 
-def dump(content, dest, fmt=None, **options):
+def dump(content, dest, fmt=None, compression='infer', per_document=False,
+         workers=None, shard_docs=None, shard_bytes=None, **options):
     """
     Serialise a document or collection to a file.
 
     The destination can be a file open for writing or a
     path to a file or to an existing directory.
+
+    The output is compressed on the fly if `compression`
+    is "gzip", "bz2", "xz", or "zstd".
+    For paths, the default "infer" selects compression
+    based on the file suffix (eg. "out.bioc.xml.gz").
+    For open files, compression requires binary mode.
+
+    If `per_document` is True, each document is written to
+    a separate file in the directory `dest`, named after
+    the document ID, using `workers` threads (see
+    Formatter.export()).
+
+    If `shard_docs` or `shard_bytes` is given, the output is
+    split into multiple files of at most this many documents
+    or (uncompressed) bytes; `dest` is then a path pattern
+    with a field for the shard number, eg.
+    "out/part-{:05d}.bioc.xml" (see Formatter.export_shards()).
+    In this case, the list of written paths is returned.
     """
     if fmt is None:
         fmt = _guess_format(dest, EXPORTERS)
     exporter = EXPORTERS[fmt](**options)
+    if shard_docs is not None or shard_bytes is not None:
+        if hasattr(dest, 'write') or per_document:
+            raise ValueError('sharding requires a path pattern as dest')
+        return exporter.export_shards(content, dest, shard_docs, shard_bytes,
+                                      compression)
+    if per_document:
+        if hasattr(dest, 'write'):
+            raise ValueError('per_document requires a directory path as dest')
+        exporter.export(content, dest, compression, per_document, workers)
+    else:
+        _dump(exporter, content, dest, compression)
+
+
+def _dump(exporter, content, dest, compression):
     if hasattr(dest, 'write'):
-        exporter.write(content, dest)
+        if compression in (None, 'infer'):
+            exporter.write(content, dest)
+        else:
+            with compress(dest, compression) as stream:
+                if not exporter.binary:
+                    stream = io.TextIOWrapper(stream, encoding='utf8')
+                with stream:
+                    exporter.write(content, stream)
     else:
-        exporter.export(content, dest)
+        exporter.export(content, dest, compression)
+
+
+def dump_many(content, outputs, compression='infer', ahead=16):
+    """
+    Serialise a document or collection to multiple files at once.
+
+    `outputs` maps destinations (see dump()) to format names
+    or to pairs <format name, dict of options>, eg.:
+
+        {'out.xml': 'bioc_xml',
+         'out.conll': ('conll', {'tagset': 'IOBES'})}
+
+    The documents are iterated over only once, so `content`
+    can be a lazy iterator of documents.
+    They are passed to the formatters, which run in separate
+    threads, in lockstep (at most `ahead` documents apart).
+    Sentences are tokenised only once and flattened entity
+    annotations are shared between the formatters.
+    """
+    from ._export import EntityCache, as_exportable
+    exporters = []
+    for dest, fmt in outputs.items():
+        fmt, options = (fmt, {}) if isinstance(fmt, str) else fmt
+        exporter = EXPORTERS[fmt](**options)
+        exporters.append((exporter, dest))
+    cache = EntityCache()
+    for exporter, _ in exporters:
+        exporter.entity_cache = cache
+    tokenize = any(exporter.tokenized for exporter, _ in exporters)
+
+    content = as_exportable(content)
+    if not isinstance(content, Collection):  # a single unit
+        for exporter, dest in exporters:
+            _dump(exporter, content, dest, compression)
+        return
+    info = content.id, content.filename
+    docs = (_prepare(doc, None, tokenize) for doc in content)
+
+    def _consumer(exporter, dest):
+        def _consume(feed):
+            coll = LazyCollection(feed, *info, **content.metadata)
+            _dump(exporter, coll, dest, compression)
+        return _consume
+
+    fan_out(docs, [_consumer(e, d) for e, d in exporters], depth=ahead)
 
 
 def dumps(content, fmt, **options):
@@ -140,11 +452,13 @@ def _guess_format(path, choices):
     except TypeError:
         pass  # raise later
     else:
-        suffix = path.suffix.lstrip('.').lower()
+        # Ignore compression suffices, eg. foo.bioc.xml.gz.
+        stripped = strip_compression_suffix(path)
+        suffix = stripped.suffix.lstrip('.').lower()
         if suffix in choices:
             return suffix
         # Try double suffices, eg. foo.bioc.json.
-        suffix2 = path.with_suffix('').suffix.lstrip('.').lower()
+        suffix2 = stripped.with_suffix('').suffix.lstrip('.').lower()
         for joiner in ('_', '.'):
             fmt = joiner.join((suffix2, suffix))
             if fmt in choices:
@@ -0,0 +1,352 @@
+"""
+Conversion pipeline: load, transform and write documents.
+"""
+
+
+__author__ = "Lenz Furrer"
+
+
+import os
+import sys
+import time
+import logging
+import functools
+import itertools as it
+from pathlib import Path
+from collections import namedtuple
+
+from ..util.stream import strip_compression_suffix, compression_extension
+from ..util.stream import atomic_wopen
+from ..util.iterate import bounded_map, iter_ahead
+
+
+def convert(source, src_fmt, dest, dest_fmt=None, transform=None, workers=0,
+            ahead=64, compression='infer', load_options=None,
+            shard_docs=None, shard_bytes=None, manifest=None, **options):
+    """
+    Convert a file to another format, document by document.
+
+    The documents are loaded lazily in a background thread
+    and written as soon as they are ready; at most `ahead`
+    documents are in flight at any time, which keeps memory
+    bounded independently of the corpus size.
+
+    If `transform` is given, it is called on each document
+    and must return a document (eg. the same one, modified).
+    With `workers` > 0, the per-document work (`transform`
+    and tokenisation for token-based output formats) runs
+    in that many worker processes; `transform` must then be
+    picklable (eg. a module-level function).
+    The workers are started with the "spawn" method, so a
+    calling script must guard its entry point with
+    `if __name__ == '__main__':`.
+
+    If src_fmt or dest_fmt is None, it is inferred from the
+    file name. Any options are passed to the formatter; the
+    loader receives the dict `load_options`.
+    With `shard_docs` or `shard_bytes`, the output is split
+    into multiple files (see dump()).
+
+    If `manifest` is a path, the job is resumable: the output
+    files are written atomically and recorded in the manifest
+    (see bconv.util.manifest.Manifest), and a restarted job
+    skips the documents of the shards (or the whole output)
+    completed earlier.
+    Skipped documents are still parsed, but not transformed
+    or written.
+
+    Return a ConversionStats tuple, which reports the number
+    of documents, the elapsed time and the peak memory usage.
+    """
+    # The package imports this module, so import its API at runtime.
+    from . import LOADERS, EXPORTERS, load, dump, _guess_format
+    if src_fmt is None:
+        src_fmt = _guess_format(source, LOADERS)
+    if dest_fmt is None:
+        dest_fmt = _guess_format(dest, EXPORTERS)
+    tokenize = EXPORTERS[dest_fmt].tokenized
+    job = functools.partial(_prepare, transform=transform, tokenize=tokenize)
+    count = 0
+
+    def _counted(docs):
+        nonlocal count
+        for doc in docs:
+            count += 1
+            yield doc
+
+    if manifest is None:
+        write = functools.partial(
+            dump, dest=dest, fmt=dest_fmt, compression=compression,
+            shard_docs=shard_docs, shard_bytes=shard_bytes, **options)
+        skip = 0
+    else:
+        if hasattr(dest, 'write'):
+            raise ValueError('a manifest requires a path as dest')
+        from ..util.manifest import Manifest
+        manifest = Manifest(manifest, _job_description(
+            src_fmt, dest_fmt, options,
+            shard_docs=shard_docs, shard_bytes=shard_bytes))
+        writer = _CheckpointWriter(
+            manifest, _source_info(source), EXPORTERS[dest_fmt](**options),
+            dest, compression, shard_docs, shard_bytes)
+        if writer.done:
+            logging.info('%s: already converted', source)
+            return ConversionStats(0, 0., _peak_memory())
+        write, skip = writer.write, writer.skip
+
+    start = time.perf_counter()
+    docs = load(source, src_fmt, mode='lazy', **(load_options or {}))
+    if skip:
+        logging.info('%s: skipping %d converted documents', source, skip)
+        docs = it.islice(docs, skip, None)
+    if workers and (transform is not None or tokenize):
+        # Create the pool before the loader thread starts.
+        with _process_pool(workers) as executor:
+            docs = bounded_map(executor, job, iter_ahead(docs, ahead), ahead)
+            write(_counted(docs))
+    else:
+        docs = iter_ahead(docs, ahead)
+        if transform is not None:
+            docs = map(job, docs)
+        write(_counted(docs))
+    elapsed = time.perf_counter() - start
+    return ConversionStats(count, elapsed, _peak_memory())
+
+
+def convert_dir(source, src_fmt, dest, dest_fmt, pattern='*', transform=None,
+                workers=None, compression=None, load_options=None,
+                manifest=None, **options):
+    """
+    Convert all files of a directory, one output file per input.
+
+    The files matching the glob `pattern` in `source` are
+    converted into the directory `dest`, keeping their
+    relative paths but with the extension of dest_fmt (eg.
+    "a/b.xml.gz" to "a/b.json"), optionally compressed with
+    `compression`.
+    The files are converted in parallel in `workers`
+    processes (default: the number of CPUs; use 0 for the
+    calling process); `transform` must then be picklable.
+    As with convert(), the workers are started with "spawn".
+    If src_fmt is None, it is inferred for each file.
+
+    Each output file is written atomically. If `manifest` is
+    given (a path, or True for "<dest>/.bconv-manifest"), the
+    completed files are recorded, so a restarted job skips
+    them, unless the input file or the output file has
+    changed in the meantime (see bconv.util.manifest).
+
+    Any options are passed to the formatter; the loader
+    receives the dict `load_options`.
+    Return a ConversionStats tuple for all files converted.
+    """
+    from . import EXPORTERS, _input_files
+    source, dest = Path(source), Path(dest)
+    exporter = EXPORTERS[dest_fmt]
+    if manifest is True:
+        manifest = dest / '.bconv-manifest'
+    if manifest is not None:
+        from ..util.manifest import Manifest
+        manifest = Manifest(manifest, _job_description(
+            src_fmt, dest_fmt, options, pattern=pattern,
+            compression=compression))
+
+    tasks, skipped = [], 0
+    for path in _input_files(source, pattern):
+        key = path.relative_to(source).as_posix()
+        target = Path(dest, strip_compression_suffix(Path(key)))
+        target = target.with_suffix('.{}'.format(exporter.ext))
+        if compression is not None:
+            target = Path('{}{}'.format(target,
+                                        compression_extension(compression)))
+        info = _source_info(path)
+        if manifest is not None and manifest.completed(key, source=info):
+            skipped += 1
+        else:
+            tasks.append((key, path, target, info))
+    if manifest is not None:
+        logging.info('%d files to convert, %d already converted',
+                     len(tasks), skipped)
+
+    start = time.perf_counter()
+    job = functools.partial(
+        _convert_file, src_fmt=src_fmt, dest_fmt=dest_fmt,
+        transform=transform, load_options=load_options, options=options)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    count = 0
+    if not workers:
+        results = map(job, tasks)
+        for (key, _, target, info), n in zip(tasks, results):
+            count += n
+            if manifest is not None:
+                manifest.record(key, target, documents=n, source=info)
+    else:
+        from concurrent.futures import as_completed
+        with _process_pool(workers) as executor:
+            futures = {executor.submit(job, task): task for task in tasks}
+            for future in as_completed(futures):
+                key, _, target, info = futures[future]
+                n = future.result()
+                count += n
+                if manifest is not None:
+                    manifest.record(key, target, documents=n, source=info)
+    elapsed = time.perf_counter() - start
+    return ConversionStats(count, elapsed, _peak_memory())
+
+
+def _convert_file(task, src_fmt, dest_fmt, transform, load_options, options):
+    from . import LOADERS, EXPORTERS, _guess_format
+    _, path, target, _ = task
+    if src_fmt is None:
+        src_fmt = _guess_format(path, LOADERS)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    encoding = None if EXPORTERS[dest_fmt].binary else 'utf8'
+    with atomic_wopen(target, encoding=encoding) as f:
+        stats = convert(path, src_fmt, f, dest_fmt, transform=transform,
+                        load_options=load_options, **options)
+    return stats.documents
+
+
+class _CheckpointWriter:
+    """
+    Atomic output for a resumable conversion.
+    """
+
+    def __init__(self, manifest, source_info, exporter, dest, compression,
+                 shard_docs, shard_bytes):
+        self.manifest = manifest
+        self.source_info = source_info
+        self.exporter = exporter
+        self.dest = dest
+        self.compression = compression
+        self.sharded = shard_docs is not None or shard_bytes is not None
+        self.limits = shard_docs, shard_bytes
+        # Find the completed shards (a contiguous prefix).
+        self.done = False
+        self.shard = self.skip = 0
+        if not self.sharded:
+            self.done = self._completed('output') is not None
+        else:
+            while True:
+                entry = self._completed('shard-{}'.format(self.shard))
+                if entry is None:
+                    break
+                self.shard += 1
+                self.skip += entry['documents']
+
+    def _completed(self, key):
+        return self.manifest.completed(key, source=self.source_info)
+
+    def write(self, docs):
+        """Write and record the output."""
+        if not self.sharded:
+            self._write_all(docs)
+            return
+        shards = self.exporter.iter_shards(
+            docs, self.dest, *self.limits, compression=self.compression,
+            start=self.shard)
+        offset = self.skip
+        for n, (path, count) in enumerate(shards, start=self.shard):
+            self.manifest.record('shard-{}'.format(n), path, documents=count,
+                                 range=[offset, offset+count],
+                                 source=self.source_info)
+            offset += count
+
+    def _write_all(self, docs):
+        count = 0
+
+        def _counted():
+            nonlocal count
+            for doc in docs:
+                count += 1
+                yield doc
+
+        dest = Path(self.dest)
+        if dest.is_dir():
+            raise ValueError('a manifest requires a file path as dest')
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        encoding = None if self.exporter.binary else 'utf8'
+        with atomic_wopen(dest, encoding=encoding,
+                          compression=self.compression) as f:
+            self.exporter.write(_counted(), f)
+        self.manifest.record('output', dest, documents=count,
+                             source=self.source_info)
+
+
+def _job_description(src_fmt, dest_fmt, options, **settings):
+    options = {k: v if isinstance(v, (str, int, float, bool, type(None)))
+               else repr(v)
+               for k, v in options.items()}
+    return dict(settings, src_fmt=src_fmt, dest_fmt=dest_fmt, options=options)
+
+
+def _source_info(source):
+    """Size and modification time of a local input file."""
+    try:
+        st = os.stat(source)
+    except (TypeError, ValueError, OSError):
+        return None
+    return {'size': st.st_size, 'mtime': st.st_mtime_ns}
+
+
+def _prepare(doc, transform, tokenize):
+    if transform is not None:
+        doc = transform(doc)
+    if tokenize:
+        for sentence in doc.units('sentence'):
+            sentence.tokenize(cache=True)
+    return doc
+
+
+def _process_pool(workers):
+    """
+    Create a pool of freshly started worker processes.
+
+    Forking a process which runs threads (eg. the loader
+    thread of convert(), or any thread of the caller) can
+    leave locks in the child in an acquired state forever.
+    Therefore the workers are started with "spawn" on all
+    platforms.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    context = multiprocessing.get_context('spawn')
+    return ProcessPoolExecutor(workers, mp_context=context)
+
+
+def _peak_memory():
+    """Get the peak RSS in bytes of this process and its children."""
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None
+    peak = max(resource.getrusage(who).ru_maxrss
+               for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+    # Linux reports KiB, macOS bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class ConversionStats(namedtuple('ConversionStats',
+                                 'documents seconds peak_memory')):
+    """
+    Throughput and memory report of a conversion.
+
+    The peak memory (None if unavailable) is the maximum
+    resident set size of the process or any of its worker
+    processes over their lifetime, in bytes.
+    """
+
+    __slots__ = ()
+
+    @property
+    def docs_per_second(self):
+        """Throughput."""
+        return self.documents / self.seconds if self.seconds else 0.
+
+    def __str__(self):
+        memory = ('unknown' if self.peak_memory is None
+                  else '{:.0f} MiB'.format(self.peak_memory / 2**20))
+        return ('{} documents in {:.2f} s ({:.0f} docs/s), peak memory {}'
+                .format(self.documents, self.seconds,
+                        self.docs_per_second, memory))
@@ -7,11 +7,17 @@ __author__ = "Lenz Furrer"
 
 
 import io
+import os
+import weakref
+import functools
+import itertools as it
+import threading
 from pathlib import Path
 
-from lxml import etree
-
-from ..util.misc import timestamp
+from ..doc.document import Collection, LazyCollection, Sentence
+from ..util.misc import timestamp, safe_filename
+from ..util.iterate import bounded_map
+from ..util.stream import wopen, atomic_wopen, compression_extension
 
 
 class Formatter:
@@ -21,29 +27,148 @@ class Formatter:
 
     ext = None  # type: str
     binary = False  # text or binary file mode?
+    tokenized = False  # does the output include tokens?
 
-    def export(self, content, dest='.'):
+    def export(self, content, dest='.', compression='infer',
+               per_document=False, workers=None):
         """
         Write this content to disk.
+
+        The output is compressed on the fly if `compression`
+        is "gzip", "bz2", "xz", or "zstd", or if it is "infer"
+        and the file suffix indicates compression (eg. ".gz").
+
+        If `per_document` is True, each document is written
+        to a separate file in the directory `dest`, named
+        after the document ID (with unsafe characters replaced
+        and a counter appended to repeated IDs; documents
+        without an ID are named after the current time).
+        The files are written in `workers` threads (default:
+        as many as suggested by concurrent.futures; use 0 for
+        the calling thread), and each of them appears only
+        when complete.
         """
-        with self._open(Path(dest), content) as stream:
+        content = as_exportable(content)
+        if per_document:
+            self._export_documents(content, Path(dest), compression, workers)
+            return
+        with self._open(Path(dest), content, compression) as stream:
             self.write(content, stream)
 
-    def _open(self, dest, content):
+    def _open(self, dest, content, compression='infer'):
         if dest.is_dir():
             basename = content.id or content.filename or timestamp()
-            dest = Path(dest, '{}.{}'.format(basename, self.ext))
+            dest = self._filename(dest, basename, compression)
         elif not dest.parent.exists():
             # Use exist_ok because of potential race conditions.
             dest.parent.mkdir(parents=True, exist_ok=True)
-        if self.binary:
-            return open(file=dest, mode='wb')
+        encoding = None if self.binary else 'utf8'
+        return wopen(dest, encoding=encoding, compression=compression)
+
+    def _filename(self, directory, basename, compression):
+        dest = Path(directory, '{}.{}'.format(basename, self.ext))
+        if compression not in (None, 'infer'):
+            dest = Path('{}{}'.format(dest,
+                                      compression_extension(compression)))
+        return dest
+
+    def _export_documents(self, content, directory, compression, workers):
+        directory.mkdir(parents=True, exist_ok=True)
+        names = _UniqueNames(fallback=timestamp())
+        # Assign the file names in this thread, in document order.
+        jobs = ((doc, self._filename(directory, names.get(doc.id),
+                                     compression))
+                for doc in content.units('document'))
+        export = functools.partial(self._export_document,
+                                   compression=compression)
+        if workers == 0:
+            for job in jobs:
+                export(job)
+            return
+        from concurrent.futures import ThreadPoolExecutor
+        if workers is None:
+            workers = min(32, (os.cpu_count() or 1) + 4)
+        with ThreadPoolExecutor(workers) as executor:
+            for _ in bounded_map(executor, export, jobs, ahead=2*workers):
+                pass
+
+    def _export_document(self, job, compression):
+        doc, dest = job
+        encoding = None if self.binary else 'utf8'
+        with atomic_wopen(dest, encoding=encoding,
+                          compression=compression) as stream:
+            self.write(doc, stream)
+
+    def export_shards(self, content, pattern, shard_docs=None,
+                      shard_bytes=None, compression='infer'):
+        """
+        Write this content to a series of files of limited size.
+
+        The file names are created from `pattern`, which has a
+        format field for the shard number, starting at 0 (eg.
+        "out/part-{:05d}.bioc.xml").
+        A new file is started after `shard_docs` documents, or
+        as soon as a file has reached `shard_bytes` bytes
+        (uncompressed size, checked between documents).
+        Formats which serialise all content at once (eg.
+        pubanno_json) can only be sharded by document count.
+
+        Each file appears only when complete.
+        Return a list with the paths of all files written.
+        """
+        shards = self.iter_shards(content, pattern, shard_docs, shard_bytes,
+                                  compression)
+        return [path for path, _ in shards]
+
+    def iter_shards(self, content, pattern, shard_docs=None,
+                    shard_bytes=None, compression='infer', start=0):
+        """
+        Write shards lazily, like export_shards().
+
+        Yield a pair <path, number of documents> as soon as
+        a file is complete.
+        The shards are numbered from `start`; unless it is 0,
+        no file is written for empty content.
+        """
+        pattern = str(pattern)
+        if pattern.format(0) == pattern.format(1):
+            raise ValueError(
+                'shard pattern needs a field for the shard number, '
+                'eg. "part-{{:05d}}.{}"'.format(self.ext))
+        if shard_docs is None and shard_bytes is None:
+            raise ValueError('need a limit (shard_docs or shard_bytes)')
+        content = as_exportable(content)
+        if isinstance(content, Collection):
+            info = (content.id, content.filename), content.metadata
         else:
-            return open(file=dest, mode='w', encoding='utf8')
+            info = (), {}
+        docs = iter(content.units('document'))
+        number = start
+        doc = next(docs, None)
+        while doc is not None or number == 0:  # write at least one file
+            dest = Path(pattern.format(number))
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            with atomic_wopen(dest, encoding=None,
+                              compression=compression) as f:
+                counter = _CountingWriter(f)
+                stream = counter
+                if not self.binary:
+                    stream = io.TextIOWrapper(counter, encoding='utf8')
+                shard = _Shard(doc, docs, stream, counter,
+                               shard_docs, shard_bytes)
+                with stream:
+                    self.write(LazyCollection(shard, *info[0], **info[1]),
+                               stream)
+            yield dest, shard.count
+            number += 1
+            doc = next(docs, None)
 
     def write(self, content, stream):
         """
         Write this content to an open file.
+
+        The content can be a Document, a Collection, or any
+        iterable of Documents, which is consumed lazily.
         """
         raise NotImplementedError()
 
@@ -68,7 +193,7 @@ class MemoryFormatter(Formatter):
     """
 
     def write(self, content, stream):
-        stream.write(self.dumps(content))
+        stream.write(self.dumps(as_exportable(content)))
 
 
 class StreamFormatter(Formatter):
@@ -99,7 +224,7 @@ class XMLMemoryFormatter(MemoryFormatter):
     binary = True
 
     def dumps(self, content):
-        node = self._dump_tree(content)
+        node = self._dump_tree(as_exportable(content))
         return self._tostring(node)
 
     def _dump_tree(self, content):
@@ -107,12 +232,101 @@ class XMLMemoryFormatter(MemoryFormatter):
 
     @staticmethod
     def _tostring(node, **kwargs):
+        from lxml import etree
         kwargs.setdefault('encoding', "UTF-8")
         kwargs.setdefault('xml_declaration', True)
         kwargs.setdefault('pretty_print', True)
         return etree.tostring(node, **kwargs)
 
 
+class _UniqueNames:
+    """
+    Safe and distinct file names for document IDs.
+
+    Missing IDs are replaced with `fallback`; repeated names
+    (ignoring case) get a counter suffix, eg. "12345-2".
+    """
+
+    def __init__(self, fallback):
+        self._fallback = fallback
+        self._used = set()
+
+    def get(self, docid):
+        """Get an unused name for this ID."""
+        basename = safe_filename(docid) or self._fallback
+        name = basename
+        for n in it.count(2):
+            if name.casefold() not in self._used:
+                break
+            name = '{}-{}'.format(basename, n)
+        self._used.add(name.casefold())
+        return name
+
+
+class _Shard:
+    """Iterate over documents until a shard limit is reached."""
+
+    def __init__(self, first, docs, stream, counter, max_docs, max_bytes):
+        self._next = first
+        self._docs = docs
+        self._stream = stream
+        self._counter = counter
+        self._max_docs = max_docs
+        self._max_bytes = max_bytes
+        self.count = 0
+
+    def __iter__(self):
+        while self._next is not None:
+            yield self._next
+            self.count += 1
+            self._next = None
+            if self._max_docs is not None and self.count >= self._max_docs:
+                return
+            if self._max_bytes is not None:
+                self._stream.flush()
+                if self._counter.count >= self._max_bytes:
+                    return
+            self._next = next(self._docs, None)
+
+
+class _CountingWriter(io.RawIOBase):
+    """
+    Binary pass-through stream which counts the bytes written.
+
+    Closing it leaves the target stream open.
+    """
+
+    def __init__(self, target):
+        super().__init__()
+        self.target = target
+        self.count = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = memoryview(data)
+        self.target.write(data)
+        self.count += data.nbytes
+        return data.nbytes
+
+    def flush(self):
+        if not self.closed:
+            self.target.flush()
+
+
+def as_exportable(content):
+    """
+    Wrap an iterable of documents in a LazyCollection.
+
+    Documents, collections and other units are returned
+    unchanged.
+    """
+    if hasattr(content, 'units'):
+        return content
+    return LazyCollection(content)
+
+
 class EntityFormatter:
     """
     Mix-in for formats with entity annotations.
@@ -123,6 +337,8 @@ class EntityFormatter:
     `avoid_overlaps` (suppress collisions).
     """
 
+    entity_cache = None  # type: EntityCache
+
     def __init__(self, *args, avoid_gaps=None, avoid_overlaps=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.avoid_gaps = avoid_gaps
@@ -132,10 +348,57 @@ class EntityFormatter:
         """
         Iterate over (potentially modified) entities in unit.
         """
+        if self.entity_cache is not None:
+            return self.entity_cache.iter_entities(
+                unit, self.avoid_gaps, self.avoid_overlaps)
         return unit.iter_entities(avoid_gaps=self.avoid_gaps,
                                   avoid_overlaps=self.avoid_overlaps)
 
 
+class EntityCache:
+    """
+    Flattened entities shared between formatters.
+
+    Assign an instance to the `entity_cache` attribute of
+    multiple formatters, so entities are flattened only once
+    per sentence and flattening strategy, no matter at which
+    level (sentence, section, document) the formatters
+    iterate over them.
+    The entries are released with their sentence.
+    """
+
+    def __init__(self):
+        self._entries = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def iter_entities(self, unit, avoid_gaps=None, avoid_overlaps=None):
+        """
+        Iterate over the entities of unit, flattened as specified.
+        """
+        if avoid_gaps is None and avoid_overlaps is None:
+            return unit.iter_entities()  # nothing to flatten
+        key = avoid_gaps, avoid_overlaps
+        return it.chain.from_iterable(
+            self._flattened(sentence, key)
+            for sentence in unit.units(Sentence))
+
+    def _flattened(self, sentence, key):
+        with self._lock:
+            views = self._entries.setdefault(sentence, {})
+            entities = views.get(key)
+            if entities is not None:
+                self.hits += 1
+                return entities
+        entities = tuple(sentence.iter_entities(avoid_gaps=key[0],
+                                                avoid_overlaps=key[1]))
+        with self._lock:
+            views[key] = entities
+            self.misses += 1
+        return entities
+
+
 class ContinuousEntityFormatter(EntityFormatter):
     """
     Mix-in for formats with gap-free entity annotations.
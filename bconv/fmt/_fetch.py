@@ -0,0 +1,182 @@
+"""
+Fetcher base class for web APIs.
+"""
+
+
+__author__ = "Lenz Furrer"
+
+
+import logging
+import threading
+import http.client
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+from ._load import DocIterator
+from ..util.http import SESSION, RateLimiter
+from ..util.cache import DiskCache
+from ..util.iterate import bounded_map
+
+
+class BatchFetcher(DocIterator):
+    """
+    Fetch documents by ID from a web API.
+
+    The document IDs are requested in batches of
+    `batch_size`, with up to `workers` concurrent
+    requests, spaced out to at most `rate` requests
+    per second across all fetchers for the same service.
+    Batches failing with one of the `retry_errors` are
+    requested again up to `batch_retries` times.
+    The documents are yielded in the order of the IDs.
+
+    If `cache` is given (a directory or a DiskCache object),
+    the raw data of each document are kept on disk, and
+    only uncached IDs are requested.
+
+    Subclasses must implement _request(), _parse() and
+    _from_raw(), and set the "name" class attribute,
+    which is used for the rate limit and the cache.
+    """
+
+    name = None  # type: str
+    rate = 3
+    # Connection and HTTP errors. Subclasses may add parse errors which
+    # indicate a truncated response (eg. PubMed's XML).
+    retry_errors = (OSError, http.client.HTTPException)
+
+    def __init__(self, session=None, batch_size=100, workers=3, rate=None,
+                 batch_retries=2, cache=None, rate_key=None, **kwargs):
+        super().__init__(**kwargs)
+        self.session = SESSION if session is None else session
+        self.batch_size = batch_size
+        self.workers = workers
+        self.batch_retries = batch_retries
+        if rate is None:
+            rate = self.rate
+        self.limiter = _rate_limiter((self.name, rate_key), rate)
+        if cache is not None and not isinstance(cache, DiskCache):
+            cache = DiskCache(cache)
+        self.cache = cache
+
+    def load_one(self, source, id):
+        # Filename makes no sense for a fetched collection -- delete it.
+        coll = super().load_one(source, id)
+        coll.filename = None
+        return coll
+
+    def iter_documents(self, source):
+        """
+        Iterate over the documents for a list of IDs.
+
+        The IDs can also be given as a comma-separated string.
+        """
+        if isinstance(source, str):
+            source = source.split(',')
+        docids = [i.strip() for i in source if i.strip()]
+        if not docids:
+            raise ValueError('Empty document-ID list.')
+        if self.cache is None:
+            for docs in self._iter_batches(docids):
+                yield from docs
+        else:
+            yield from self._iter_cached(docids)
+
+    def _request(self, docids):
+        """Send a request for a batch of IDs; return the response."""
+        raise NotImplementedError()
+
+    def _parse(self, stream, raw=False):
+        """Iterate over pairs <document, raw data or None>."""
+        raise NotImplementedError()
+
+    def _from_raw(self, data):
+        """Parse a cached document."""
+        raise NotImplementedError()
+
+    @staticmethod
+    def _normalize_id(docid):
+        """Make requested and returned IDs comparable."""
+        return str(docid)
+
+    def _iter_cached(self, docids):
+        missing = list(dict.fromkeys(
+            i for i in docids if self._cache_key(i) not in self.cache))
+        batch_of = {i: n//self.batch_size for n, i in enumerate(missing)}
+        batches = self._iter_batches(missing)
+        current, done = {}, -1
+        # Merge cached and fetched documents in input order.
+        for docid in docids:
+            batch = batch_of.pop(docid, None)
+            if batch is not None and batch > done:
+                yield from current.values()  # unexpected IDs
+                current = {self._normalize_id(d.id): d for d in next(batches)}
+                done = batch
+            doc = current.pop(self._normalize_id(docid), None)
+            if doc is None:
+                doc = self._from_cache(docid)
+            if doc is None and batch is None:  # evicted in the meantime
+                yield from self._fetch_batch([docid])
+            elif doc is not None:
+                yield doc
+        yield from current.values()
+
+    def _from_cache(self, docid):
+        data = self.cache.get(self._cache_key(docid))
+        if data is None:
+            return None
+        return self._from_raw(data)
+
+    def _cache_key(self, docid):
+        return '{}/{}'.format(self.name, self._normalize_id(docid))
+
+    def _iter_batches(self, docids):
+        batches = [docids[i:i+self.batch_size]
+                   for i in range(0, len(docids), self.batch_size)]
+        if len(batches) <= 1 or self.workers <= 1:
+            yield from map(self._fetch_batch, batches)
+            return
+        with ThreadPoolExecutor(self.workers) as executor:
+            yield from bounded_map(executor, self._fetch_batch, batches,
+                                   ahead=self.workers)
+
+    def _fetch_batch(self, docids):
+        for attempt in range(self.batch_retries+1):
+            try:
+                with self._request(docids) as f:
+                    docs = list(self._parse_response(f))
+            except self.retry_errors as e:
+                permanent = (isinstance(e, urllib.error.HTTPError)
+                             and e.code not in self.session.retry_status)
+                if permanent or attempt == self.batch_retries:
+                    raise
+                logging.warning('%s batch failed (%s), retrying', self.name, e)
+            else:
+                return self._in_order(docs, docids)
+
+    def _parse_response(self, stream):
+        caching = self.cache is not None
+        for doc, raw in self._parse(stream, raw=caching):
+            if caching:
+                self.cache.put(self._cache_key(doc.id), raw)
+            yield doc
+
+    def _in_order(self, docs, docids):
+        rank = {self._normalize_id(i): n for n, i in enumerate(docids)}
+        return sorted(
+            docs, key=lambda d: rank.get(self._normalize_id(d.id), len(rank)))
+
+
+# Rate limits usually apply per API key (or IP address),
+# so all fetchers share a limiter for the same service and key.
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def _rate_limiter(key, rate):
+    with _LIMITERS_LOCK:
+        try:
+            return _LIMITERS[key, rate]
+        except KeyError:
+            limiter = _LIMITERS[key, rate] = RateLimiter(rate)
+            return limiter
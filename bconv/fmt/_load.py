@@ -6,8 +6,16 @@ Loader base classes.
 __author__ = "Lenz Furrer"
 
 
+import re
+import gc
+import pickle
+import functools
+import itertools as it
+from contextlib import contextmanager
+
 from ..doc.document import Collection
-from ..util.stream import basename
+from ..util.stream import basename, mapped, iter_chunks, iter_ranges
+from ..util.iterate import bounded_map
 
 
 class Loader:
@@ -82,6 +90,140 @@ class DocIterator(Loader):
         raise NotImplementedError()
 
 
+class ChunkParser:
+    """
+    Mixin for parsing a local file in parallel.
+
+    If `workers` is a positive number, local uncompressed
+    files are split at document boundaries into chunks of
+    about `chunk_size` bytes, which are parsed in parallel
+    processes.
+
+    Subclasses must set the attributes `workers` and
+    `chunk_size`, provide a `_boundary` regex (see
+    util.stream.iter_chunks), and implement _iter_slice().
+    If entities are numbered through a counter, set
+    `_counted_ids` to True.
+
+    For random access to single documents (see iter_index()
+    and iter_spans()), subclasses must provide a `_docid`
+    regex, which matches the document ID in group 1 at the
+    start of a document slice.
+    """
+
+    _counted_ids = False
+    _docid = None  # type: re.Pattern
+
+    def _iter_parallel(self, path, *args, shared_ids=False, span=()):
+        """
+        Iterate over the documents of all chunks in order.
+
+        Any args are passed to _iter_slice().
+        With `shared_ids`, entities are numbered throughout
+        the whole file rather than per document.
+        A <start, end> `span` restricts parsing to a byte range.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        job = functools.partial(self._parse_chunk, path, args, shared_ids)
+        renumber = shared_ids and self._counted_ids
+        offset = 0
+        with mapped(path) as buffer, \
+                ProcessPoolExecutor(self.workers) as executor:
+            spans = iter_chunks(buffer, self._boundary, self.chunk_size,
+                                *span)
+            for data in bounded_map(executor, job, spans,
+                                    ahead=2*self.workers):
+                with _gc_paused():
+                    docs = pickle.loads(data)
+                if renumber:
+                    offset = _renumber_entities(docs, offset)
+                yield from docs
+
+    def _iter_mapped(self, path, *args):
+        """
+        Parse a memory-mapped file document by document.
+
+        Any args are passed to _iter_slice().
+        """
+        with mapped(path) as buffer:
+            for start, end in iter_ranges(buffer, self._boundary):
+                yield from self._iter_slice(buffer[start:end], *args)
+
+    def iter_index(self, path):
+        """
+        Locate the documents of a local uncompressed file.
+
+        Iterate over <document ID, offset, length> triples.
+        """
+        with mapped(path) as buffer:
+            for start, end in iter_ranges(buffer, self._boundary,
+                                          *self._index_span(buffer)):
+                match = self._docid.match(buffer, start, end)
+                if match is not None:
+                    yield self._decode_id(match.group(1)), start, end-start
+
+    def iter_spans(self, path, spans):
+        """
+        Parse the documents at the given <offset, length> spans.
+        """
+        args = self._slice_args(path)
+        with open(path, 'rb') as f:
+            for offset, length in spans:
+                f.seek(offset)
+                yield from self._iter_slice(f.read(length), *args)
+
+    def _index_span(self, buffer):
+        """Byte range of the documents, if not the whole file."""
+        return ()
+
+    def _slice_args(self, path):
+        """Arguments to _iter_slice() for single documents."""
+        return ()
+
+    @staticmethod
+    def _decode_id(data):
+        return data.decode('utf8').strip()
+
+    def _parse_chunk(self, path, args, shared_ids, span):
+        start, end = span
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end-start)
+        counter = it.count(1) if shared_ids else None
+        docs = list(self._iter_slice(data, *args, counter))
+        return pickle.dumps(docs, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+@contextmanager
+def _gc_paused():
+    """
+    Suspend garbage collection.
+
+    Unpickling many objects at once triggers frequent
+    collection runs, which traverse all live objects.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _renumber_entities(docs, offset):
+    """Shift chunk-level entity IDs; return the new maximum."""
+    top = offset
+    seen = set()
+    for doc in docs:
+        for entity in doc.iter_entities():
+            if id(entity) not in seen:
+                seen.add(id(entity))
+                entity.id += offset
+                top = max(top, entity.id)
+    return top
+
+
 def wrap_in_collection(content):
     """
     If this is a document, wrap it in a collection.
@@ -109,3 +251,20 @@ def text_node(tree_or_elem, xpath, onerror=None, ifnone=None):
         if text is None:
             text = ifnone
     return text
+
+
+def free_node(node):
+    """
+    Free the memory of a processed iterparse node.
+
+    Besides clearing the node, remove all preceding nodes
+    from the tree, including siblings of its ancestors
+    (eg. unparsed metadata next to the processed nodes).
+    """
+    node.clear()
+    for elem in it.chain([node], node.iterancestors()):
+        parent = elem.getparent()
+        if parent is None:  # root: preceding comments/PIs can't be removed
+            break
+        while elem.getprevious() is not None:
+            del parent[0]
@@ -0,0 +1,103 @@
+"""
+Registry of format names with lazily imported classes.
+"""
+
+
+__author__ = "Lenz Furrer"
+
+
+import importlib
+from collections.abc import MutableMapping
+
+
+class FormatRegistry(MutableMapping):
+    """
+    Mapping from format names to loader/formatter classes.
+
+    Classes can be registered as such or as import paths
+    ("module:Class", relative to bconv.fmt if the module
+    starts with a dot), which are imported on first lookup.
+
+    Third-party packages can add formats through the
+    entry-point group `group` (eg. "bconv.loaders"), eg. in
+    pyproject.toml:
+
+        [project.entry-points."bconv.loaders"]
+        myformat = "mypackage.module:MyLoader"
+
+    Entry points are only inspected for names that aren't
+    registered otherwise, or when listing all formats.
+    Built-in formats take precedence.
+    """
+
+    def __init__(self, group, formats=()):
+        self.group = group
+        self._formats = dict(formats)
+        self._discovered = False
+
+    def __getitem__(self, name):
+        try:
+            cls = self._formats[name]
+        except KeyError:
+            if self._discover():
+                return self[name]
+            raise
+        if isinstance(cls, str):
+            cls = self._formats[name] = _import(cls)
+        return cls
+
+    def __contains__(self, name):
+        if name in self._formats:
+            return True
+        return self._discover() and name in self._formats
+
+    def __setitem__(self, name, cls):
+        self._formats[name] = cls
+
+    def __delitem__(self, name):
+        del self._formats[name]
+
+    def __iter__(self):
+        self._discover()
+        return iter(self._formats)
+
+    def __len__(self):
+        self._discover()
+        return len(self._formats)
+
+    def __repr__(self):
+        return '<{} {!r}: {}>'.format(type(self).__name__, self.group,
+                                      ', '.join(self))
+
+    def _discover(self):
+        """
+        Add formats from entry points; return True if any are new.
+        """
+        if self._discovered:
+            return False
+        self._discovered = True
+        new = False
+        for ep in _entry_points(self.group):
+            if ep.name not in self._formats:
+                self._formats[ep.name] = ep.value
+                new = True
+        return new
+
+
+def _import(path):
+    module, _, name = path.partition(':')
+    return getattr(importlib.import_module(module, __package__), name)
+
+
+def _entry_points(group):
+    try:
+        from importlib import metadata
+    except ImportError:  # Python < 3.8
+        try:
+            import importlib_metadata as metadata
+        except ImportError:
+            return ()
+    eps = metadata.entry_points()
+    if hasattr(eps, 'select'):  # Python >= 3.10
+        return eps.select(group=group)
+    return eps.get(group, ())
@@ -9,7 +9,7 @@ __all__ = ['BioCXMLLoader', 'BioCJSONLoader',
            'BioCXMLFormatter', 'BioCJSONFormatter']
 
 
-import os
+import re
 import json
 from collections import OrderedDict
 
@@ -17,11 +17,13 @@ from lxml import etree
 from lxml.builder import E
 
 from ..doc.document import Collection, Document, Entity, Relation
-from ._load import CollLoader, text_node, wrap_in_collection
+from ._load import CollLoader, ChunkParser, text_node, wrap_in_collection
 from ._export import XMLMemoryFormatter, StreamFormatter, EntityFormatter
+from ._export import as_exportable
 from ..util.iterate import peek, json_iterencode
-from ..util.misc import iter_codepoint_indices_utf8, iter_byte_indices_utf8
-from ..util.stream import text_stream, basename
+from ..util.misc import SparseCodepointIndices, SparseByteIndices
+from ..util.stream import text_stream, bin_stream, basename
+from ..util.stream import local_path, mapped
 
 
 class _OffsetMixin:
@@ -56,10 +58,14 @@ class _BioCLoader(CollLoader, _OffsetMixin):
 
     def collection(self, source, id):
         coll_node, docs = self._parse_collection(source)
+        return self._collection(coll_node, map(self._document, docs),
+                                id, source)
+
+    def _collection(self, coll_node, docs, id, source):
         collection = Collection(id, basename(source))
         collection.metadata = self._meta_dict(coll_node)
         for doc in docs:
-            collection.add_document(self._document(doc))
+            collection.add_document(doc)
         return collection
 
     def _parse_collection(self, source):
@@ -166,27 +172,97 @@ class _BioCLoader(CollLoader, _OffsetMixin):
         raise NotImplementedError
 
 
-class BioCXMLLoader(_BioCLoader):
+class BioCXMLLoader(_BioCLoader, ChunkParser):
     """
     Parser for BioC XML.
+
+    Chunks for parallel parsing (see ChunkParser) are
+    split at <document> elements.
     """
 
+    _boundary = re.compile(rb'(?=<document[\s>])')
+    _xml_decl = re.compile(rb'(?:\xef\xbb\xbf)?\s*(<\?xml[^>]*\?>)')
+    _docid = re.compile(rb'<document[^>]*>\s*<id>([^<]*)</id>')
+
+    def __init__(self, byte_offsets=True, workers=0, chunk_size=2**23):
+        super().__init__(byte_offsets)
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+    def collection(self, source, id):
+        parsed = self._parse_parallel(source)
+        if parsed is None:
+            return super().collection(source, id)
+        return self._collection(*parsed, id, source)
+
     def _parse_collection(self, source):
         first, docs = peek(self._iterparse(source))
         coll_node = first.getparent()
         return coll_node, docs
 
     def iter_documents(self, source):
+        parsed = self._parse_parallel(source)
+        if parsed is not None:
+            yield from parsed[1]
+            return
         for doc in self._iterparse(source):
             yield self._document(doc)
 
+    def _parse_parallel(self, source):
+        """
+        Parse the collection header and start parsing chunks.
+
+        Return None if the source doesn't qualify.
+        """
+        path = local_path(source) if self.workers else None
+        if path is None:
+            return None
+        with mapped(path) as buffer:
+            match = self._boundary.search(buffer)
+            if match is None:
+                return None
+            start = match.start()
+            end = buffer.rfind(b'</collection>', start)
+            header = bytes(buffer[:start])
+        try:
+            coll_node = etree.fromstring(header + b'</collection>')
+        except etree.XMLSyntaxError:
+            return None  # leave it to the serial parser to complain
+        if end == -1:
+            return None
+        # Keep the XML declaration, which might specify an encoding.
+        decl = self._xml_decl.match(header)
+        prefix = (decl.group(1) if decl else b'') + b'<collection>'
+        docs = self._iter_parallel(path, prefix, span=(start, end))
+        return coll_node, docs
+
+    def _index_span(self, buffer):
+        match = self._boundary.search(buffer)
+        if match is None:
+            return 0, 0
+        return match.start(), buffer.rfind(b'</collection>', match.start())
+
+    def _slice_args(self, path):
+        with open(path, 'rb') as f:
+            decl = self._xml_decl.match(f.read(1024))
+        prefix = (decl.group(1) if decl else b'') + b'<collection>'
+        return (prefix,)
+
+    @staticmethod
+    def _decode_id(data):
+        return etree.fromstring(b'<id>' + bytes(data) + b'</id>').text or ''
+
+    def _iter_slice(self, data, prefix, _=None):
+        root = etree.fromstring(prefix + data + b'</collection>')
+        for node in root.iterfind('document'):
+            yield self._document(node)
+
     @staticmethod
     def _iterparse(source):
-        if isinstance(source, os.PathLike):
-            source = str(source)
-        for _, node in etree.iterparse(source, tag='document'):
-            yield node
-            node.clear()
+        with bin_stream(source) as f:
+            for _, node in etree.iterparse(f, tag='document'):
+                yield node
+                node.clear()
 
     def infon_dict(self, node):
         return {n.attrib['key']: n.text for n in self._iterfind(node, 'infon')}
@@ -255,6 +331,7 @@ class BioCXMLFormatter(_BioCFormatter, XMLMemoryFormatter, _OffsetMixin):
     doctype = '<!DOCTYPE collection SYSTEM "BioC.dtd">'
 
     def write(self, content, stream):
+        content = as_exportable(content)
         if isinstance(content, Collection):
             # For their size, serialise collections in a memory-friendly way.
             # The downside is that indentation isn't perfect.
@@ -402,7 +479,7 @@ class BioCJSONFormatter(_BioCFormatter, StreamFormatter, _OffsetMixin):
     ext = 'json'
 
     def write(self, content, stream):
-        coll = wrap_in_collection(content)
+        coll = wrap_in_collection(as_exportable(content))
         prep = self._collection(coll)
         stream.writelines(json_iterencode(prep))
 
@@ -533,7 +610,8 @@ class _OffsetConverter(_OffsetManager):
         # Start anchors for the current text unit:
         self._cursor_source = None
         self._cursor_target = None
-        # Character-level offset mapping for the current text unit:
+        # Character-level offset mapping for the current text unit
+        # (any sequence type, eg. a sparse mapping):
         self._conv_index = None
 
     def start(self, unit):
@@ -541,7 +619,7 @@ class _OffsetConverter(_OffsetManager):
 
     def update(self, unit, text):
         # Update internal state.
-        self._conv_index = list(self._indexer(text))
+        self._conv_index = self._indexer(text)
         self._cursor_source = self._start(unit)
         self._cursor_target = self._cursor_source + self._diff
         len_target = self._conv_index[-1]
@@ -583,7 +661,7 @@ class ByteOffsetReader(OffsetReader, _OffsetConverter):
     Offset conversion from bytes to codepoints.
     """
 
-    _indexer = staticmethod(iter_byte_indices_utf8)
+    _indexer = SparseByteIndices
 
 
 class OffsetWriter(_OffsetManager):
@@ -619,7 +697,7 @@ class ByteOffsetWriter(OffsetWriter, _OffsetConverter):
     Offset conversion from codepoints to bytes.
     """
 
-    _indexer = staticmethod(iter_codepoint_indices_utf8)
+    _indexer = SparseCodepointIndices
 
     def entity(self, entity):
         for start, end in entity.spans:
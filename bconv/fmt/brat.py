@@ -11,7 +11,7 @@ __all__ = ['BratFormatter', 'BioNLPFormatter']
 import re
 from collections import defaultdict
 
-from ._export import StreamFormatter, EntityFormatter
+from ._export import StreamFormatter, EntityFormatter, as_exportable
 from ..util.iterate import pids
 
 
@@ -32,7 +32,7 @@ class _BaseBratFormatter(StreamFormatter, EntityFormatter):
 
     def write(self, content, stream):
         counters = [pids(prefix) for prefix in 'TNARE']
-        for doc in content.units('document'):
+        for doc in as_exportable(content).units('document'):
             self._write_anno(stream, doc, counters)
 
     def _write_anno(self, stream, document, counters):
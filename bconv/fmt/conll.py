@@ -11,16 +11,18 @@ __author__ = "Lenz Furrer"
 __all__ = ['CoNLLLoader', 'CoNLLFormatter']
 
 
+import re
 import csv
 import itertools as it
 from collections import deque
 
-from ._load import DocIterator
-from ._export import StreamFormatter, ContinuousEntityFormatter
+from ._load import DocIterator, ChunkParser
+from ._export import StreamFormatter, ContinuousEntityFormatter, as_exportable
 from ..doc.document import Document, Entity
 from ..util.misc import tsv_format
 from ..util.iterate import context_coroutine
 from ..util.stream import text_stream, basename
+from ..util.stream import local_path, decode_lines
 
 
 # Lookup constants.
@@ -35,20 +37,52 @@ INSIDE = ('I', 'E')
 BEGIN = ('B', 'S')
 
 
-class CoNLLLoader(DocIterator):
-    """Read verticalized, annotated text."""
+class CoNLLLoader(DocIterator, ChunkParser):
+    """
+    Read verticalized, annotated text.
 
-    def __init__(self, label='type'):
+    If `mmap` is True, local uncompressed files are
+    memory-mapped and split at the "# doc_id = " lines;
+    only the document slices are decoded.
+    See ChunkParser for the `workers` and `chunk_size`
+    options.
+    """
+
+    _boundary = re.compile(rb'(?:^|\n)(?=# doc_id = )')
+    _docid = re.compile(rb'# doc_id = ([^\r\n]*)')
+    _counted_ids = True
+
+    def __init__(self, label='type', workers=0, chunk_size=2**23,
+                 mmap=False):
         self.label = label
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.mmap = mmap
 
     def iter_documents(self, source):
-        with text_stream(source) as f:
-            rows = csv.reader(f, **tsv_format)
-            default_docid = basename(source)
-            yield from self._iter_documents(rows, default_docid)
+        default_docid = basename(source)
+        path = local_path(source) if self.workers or self.mmap else None
+        if path is not None and self.workers:
+            yield from self._iter_parallel(path, default_docid,
+                                           shared_ids=True)
+        elif path is not None:
+            # Entity IDs are unique across the whole file.
+            yield from self._iter_mapped(path, default_docid, it.count(1))
+        else:
+            with text_stream(source) as f:
+                rows = csv.reader(f, **tsv_format)
+                yield from self._iter_documents(rows, default_docid)
+
+    def _slice_args(self, path):
+        return (basename(path),)
+
+    def _iter_slice(self, data, default_docid, ids=None):
+        rows = csv.reader(decode_lines(data), **tsv_format)
+        yield from self._iter_documents(rows, default_docid, ids)
 
-    def _iter_documents(self, rows, default_docid):
-        ids = it.count(1)
+    def _iter_documents(self, rows, default_docid, ids=None):
+        if ids is None:
+            ids = it.count(1)
         for docid, doc_rows in it.groupby(rows, _DocIDTracker(default_docid)):
             if docid is not _DocIDTracker.DocumentSeparator:
                 yield self._document(docid, doc_rows, ids)
@@ -149,6 +183,7 @@ class CoNLLFormatter(StreamFormatter, ContinuousEntityFormatter):
     """Tab-separated verticalized text with annotations."""
 
     ext = 'conll'
+    tokenized = True
 
     def __init__(self, label='type', tagset='IOBES',
                  include_docid=True, include_offsets=True,
@@ -169,7 +204,7 @@ class CoNLLFormatter(StreamFormatter, ContinuousEntityFormatter):
     def write(self, content, stream):
         writer = csv.writer(stream, **tsv_format)
 
-        for doc in content.units('document'):
+        for doc in as_exportable(content).units('document'):
             writer.writerows(self._document(doc))
 
     def _document(self, doc):
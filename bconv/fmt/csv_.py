@@ -10,7 +10,7 @@ __all__ = ['CSVFormatter', 'TSVFormatter', 'TextCSVFormatter', 'TextTSVFormatter
 
 import csv
 
-from ._export import StreamFormatter, ContinuousEntityFormatter
+from ._export import StreamFormatter, ContinuousEntityFormatter, as_exportable
 from ..util.iterate import CacheOneIter
 from ..util.misc import tsv_format
 
@@ -21,6 +21,7 @@ class CSVFormatter(StreamFormatter, ContinuousEntityFormatter):
     """
 
     ext = 'csv'
+    tokenized = True
 
     def __init__(self, fields=(), include_header=False,
                  avoid_gaps='split', avoid_overlaps=None, **fmtparams):
@@ -34,7 +35,7 @@ class CSVFormatter(StreamFormatter, ContinuousEntityFormatter):
 
         if self.include_header:
             writer.writerow(self._header())
-        for doc in content.units('document'):
+        for doc in as_exportable(content).units('document'):
             writer.writerows(self._document(doc))
 
     def _header(self):
@@ -13,7 +13,8 @@ import json
 import zipfile
 import itertools as it
 
-from ._export import StreamFormatter, ContinuousEntityFormatter
+from ._export import StreamFormatter, ContinuousEntityFormatter, as_exportable
+from ..util.misc import timestamp
 
 
 class EuPMCFormatter(StreamFormatter, ContinuousEntityFormatter):
@@ -32,7 +33,7 @@ class EuPMCFormatter(StreamFormatter, ContinuousEntityFormatter):
          self.uri) = meta
 
     def write(self, content, stream):
-        documents = content.units('document')
+        documents = as_exportable(content).units('document')
         self._write(documents, stream)
 
     def _write(self, documents, stream):
@@ -109,6 +110,7 @@ class EuPMCZipFormatter(EuPMCFormatter):
     binary = True
 
     def write(self, content, stream):
+        content = as_exportable(content)
         documents = content.units('document')
         # Iterate in hunks of 10,000, the max number of lines per file allowed.
         hunks = it.groupby(documents, key=lambda _, i=it.count(): next(i)//10000)
@@ -116,7 +118,7 @@ class EuPMCZipFormatter(EuPMCFormatter):
         with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as zf:
             for n, hunk in hunks:
                 arcname = '{}_{}.jsonl'.format(
-                    content.id or content.filename, n+1)
+                    content.id or content.filename or timestamp(), n+1)
                 try:
                     member = zf.open(arcname, mode='w')
                 except RuntimeError:  # Python < 3.6 doesn't support mode='w'
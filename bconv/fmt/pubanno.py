@@ -21,7 +21,7 @@ from collections import defaultdict
 from contextlib import contextmanager
 
 from ._load import DocLoader, DocIterator
-from ._export import Formatter, StreamFormatter, EntityFormatter
+from ._export import Formatter, StreamFormatter, EntityFormatter, as_exportable
 from ..doc.document import Collection, Document, Section, Entity, Relation
 from ..util.iterate import pids
 from ..util.stream import text_stream, bin_stream, basename
@@ -175,6 +175,7 @@ class PubAnnoJSONFormatter(Formatter, EntityFormatter):
         return json.dumps(self._prepare(content), indent=2)
 
     def _prepare(self, content):
+        content = as_exportable(content)
         if isinstance(content, Section):
             json_object = self._division(content)
         elif isinstance(content, Document):
@@ -283,7 +284,7 @@ class PubAnnoTGZFormatter(StreamFormatter, PubAnnoJSONFormatter):
 
     def write(self, content, stream):
         with tarfile.open(fileobj=stream, mode='w:gz') as tar:
-            for doc in content.units(Document):
+            for doc in as_exportable(content).units(Document):
                 for name, div in self._iter_divs(doc):
                     blob = json.dumps(div, indent=2).encode('utf8')
                     info = tarfile.TarInfo(name)
@@ -8,17 +8,16 @@ __author__ = "Lenz Furrer"
 __all__ = ['PXMLLoader', 'PXMLFetcher', 'PMCLoader', 'PMCFetcher']
 
 
-import os
 import logging
-import urllib.parse
-import urllib.request
 import itertools as it
 
 from lxml import etree
 
-from ._load import DocIterator, text_node
+from ._load import DocIterator, text_node, free_node
+from ._fetch import BatchFetcher
 from ..doc.document import Document, Entity
 from ..nlp.tokenize import TOKENIZER
+from ..util.stream import bin_stream
 
 
 class _MedlineParser:
@@ -29,8 +28,8 @@ class _MedlineParser:
     tag = ('MedlineCitation', 'BookDocument')
 
     def __init__(self, single_section=False,
-                 include_mesh=False, mesh_as_entities=False):
-        super().__init__()
+                 include_mesh=False, mesh_as_entities=False, **kwargs):
+        super().__init__(**kwargs)
         self.single_section = single_section
         self.include_mesh = include_mesh
         self.mesh_as_entities = mesh_as_entities
@@ -234,54 +233,71 @@ class _IterparseLoader(DocIterator):
     tag = None  # type: str
 
     def iter_documents(self, source):
-        if isinstance(source, os.PathLike):
-            source = str(source)
-        for _, node in etree.iterparse(source, tag=self.tag):
-            yield self._document(node, None)
-            node.clear()  # free memory
+        with bin_stream(source) as f:
+            for _, node in etree.iterparse(f, tag=self.tag):
+                yield self._document(node, None)
+                free_node(node)
 
     def _document(self, node, docid):
         raise NotImplementedError()
 
 
-class _NCBIFetcher(_IterparseLoader):
+class _NCBIFetcher(BatchFetcher, _IterparseLoader):
     """
     Fetch documents from NCBI's efetch interface.
 
+    NCBI's rate limit (3 requests per second, or 10
+    with an API key) is respected across all fetchers
+    in this process; use `rate` to override it.
+    See BatchFetcher for the other options.
+
     Subclasses must override the "db" class attribute.
     """
 
     url = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi'
     db = None  # type: str
-
-    def __init__(self, *args, tool='bconv', email=None, api_key=None, **kwargs):
-        super().__init__(*args, **kwargs)
+    name = 'ncbi'
+    retry_errors = BatchFetcher.retry_errors + (etree.XMLSyntaxError,)
+
+    def __init__(self, *args, tool='bconv', email=None, api_key=None,
+                 batch_size=200, rate=None, **kwargs):
+        if rate is None:
+            rate = 3 if api_key is None else 10
+        super().__init__(*args, batch_size=batch_size, rate=rate,
+                         rate_key=api_key, **kwargs)
         self.policy = {
             k: v
             for k, v in [('tool', tool), ('email', email), ('api_key', api_key)]
             if v is not None}
 
-    def load_one(self, source, id):
-        # Filename makes no sense for a fetched collection -- delete it.
-        coll = super().load_one(source, id)
-        coll.filename = None
-        return coll
-
-    def iter_documents(self, source):
-        """
-        Iterate over documents from NCBI.
-        """
-        docids = source if isinstance(source, str) else ','.join(source)
-        if not docids:
-            raise ValueError('Empty document-ID list.')
-        query = urllib.parse.urlencode(
-            dict(db=self.db, retmode='xml', id=docids, **self.policy))
+    def _request(self, docids):
+        query = dict(db=self.db, retmode='xml', id=','.join(docids),
+                     **self.policy)
         logging.info(
             "POST request to NCBI's efetch API with the query %r", query)
-        req = urllib.request.Request(self.url, data=query.encode('ascii'))
+        return self.session.post(self.url, query, throttle=self.limiter.wait)
+
+    def _parse(self, stream, raw=False):
+        with bin_stream(stream) as f:
+            for _, node in etree.iterparse(f, tag=self.tag):
+                doc = self._document(node, None)
+                data = etree.tostring(node, with_tail=False) if raw else None
+                yield doc, data
+                free_node(node)
+
+    def _from_raw(self, data):
+        return self._document(etree.fromstring(data), None)
 
-        with urllib.request.urlopen(req) as f:
-            yield from super().iter_documents(f)
+    def _cache_key(self, docid):
+        return '{}/{}'.format(self.db, self._normalize_id(docid))
+
+    @staticmethod
+    def _normalize_id(docid):
+        """Strip the "PMC" prefix for comparison."""
+        docid = str(docid)
+        if docid[:3].upper() == 'PMC':
+            docid = docid[3:]
+        return docid
 
 
 class PXMLLoader(_MedlineParser, _IterparseLoader):
@@ -5,30 +5,45 @@ Loader and formatter for the PubTator format.
 
 __author__ = "Lenz Furrer"
 
-__all__ = ['PubTatorLoader', 'PubTatorFBKLoader',
+__all__ = ['PubTatorLoader', 'PubTatorFBKLoader', 'PubTatorFetcher',
            'PubTatorFormatter', 'PubTatorFBKFormatter']
 
 
+import re
 import csv
 import itertools as it
 
-from ._load import CollLoader
-from ._export import StreamFormatter, ContinuousEntityFormatter
+from ._load import CollLoader, ChunkParser
+from ._export import StreamFormatter, ContinuousEntityFormatter, as_exportable
 from ..doc.document import Collection, Document, Entity
 from ..util.misc import tsv_format
 from ..util.stream import text_stream, basename
+from ..util.stream import local_path, iter_ranges, decode_lines
 
 
-class PubTatorLoader(CollLoader):
+class PubTatorLoader(CollLoader, ChunkParser):
     """
     Load PubTator documents.
+
+    If `mmap` is True, local uncompressed files are
+    memory-mapped and split into documents at the byte
+    level; only the document slices are decoded.
+    See ChunkParser for the `workers` and `chunk_size`
+    options.
     """
 
     _section_labels = {'t': 'Title', 'a': 'Abstract'}
+    _boundary = re.compile(rb'\n(?:[ \t\r\f\v]*\n)+')
+    _docid = re.compile(rb'\s*([^|\t\r\n]+)\|')
+    _counted_ids = True
 
-    def __init__(self, meta=('type', 'cui')):
+    def __init__(self, meta=('type', 'cui'), workers=0, chunk_size=2**23,
+                 mmap=False):
         (self.type,
          self.cui) = meta
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.mmap = mmap
 
     def collection(self, source, id):
         entity_counter = it.count(1)
@@ -39,10 +54,35 @@ class PubTatorLoader(CollLoader):
         return self._iter_documents(source)
 
     def _iter_documents(self, source, entity_counter=None):
-        with text_stream(source) as f:
-            for doc_lines in self._split(f):
+        path = local_path(source) if self.workers or self.mmap else None
+        if path is not None and self.workers:
+            yield from self._iter_parallel(
+                path, shared_ids=entity_counter is not None)
+        elif path is not None:
+            yield from self._iter_mapped(path, entity_counter)
+        else:
+            with text_stream(source) as f:
+                for doc_lines in self._split(f):
+                    yield self._document(doc_lines, entity_counter)
+
+    def _iter_slice(self, data, entity_counter=None):
+        # Find the documents at the byte level and decode them one by one.
+        for start, end in iter_ranges(data, self._boundary):
+            doc_lines = decode_lines(data[start:end]).readlines()
+            doc_lines = self._strip_blank(doc_lines)
+            if doc_lines:
                 yield self._document(doc_lines, entity_counter)
 
+    @staticmethod
+    def _strip_blank(lines):
+        """Remove leading and trailing blank lines."""
+        start, end = 0, len(lines)
+        while start < end and lines[start].isspace():
+            start += 1
+        while end > start and lines[end-1].isspace():
+            end -= 1
+        return lines[start:end]
+
     @staticmethod
     def _split(stream):
         doc_lines = []
@@ -121,8 +161,10 @@ class PubTatorFBKLoader(PubTatorLoader):
     Load FBK-flavored PubTator documents.
     """
 
-    def __init__(self, meta='type'):
-        super().__init__([meta, None])
+    _counted_ids = False
+
+    def __init__(self, meta='type', **kwargs):
+        super().__init__([meta, None], **kwargs)
         del self.cui
 
     def _entity(self, _, id_, type_, start, end, text):
@@ -149,7 +191,7 @@ class PubTatorFormatter(StreamFormatter, ContinuousEntityFormatter):
     def write(self, content, stream):
         tsv = csv.writer(stream, **tsv_format)
         first = True
-        for doc in content.units('document'):
+        for doc in as_exportable(content).units('document'):
             if first:
                 first = False
             else:
@@ -231,3 +273,12 @@ class PubTatorFBKFormatter(PubTatorFormatter):
     def _entity_type(self, entity):
         type_, *_ = self._entity_meta(entity)
         return type_
+
+
+def __getattr__(name):
+    # The fetcher and its dependencies are imported only on demand.
+    if name == 'PubTatorFetcher':
+        from .pubtator_central import PubTatorFetcher
+        return PubTatorFetcher
+    raise AttributeError('module {!r} has no attribute {!r}'
+                         .format(__name__, name))
@@ -0,0 +1,86 @@
+"""
+Fetcher for PubTator Central.
+"""
+
+
+__author__ = "Lenz Furrer"
+
+__all__ = ['PubTatorFetcher']
+
+
+import urllib.parse
+
+from lxml import etree
+
+from ._fetch import BatchFetcher
+from .bioc import BioCXMLLoader
+from .pubtator import PubTatorLoader
+from ..util.stream import text_stream, decode_lines
+
+
+class PubTatorFetcher(BatchFetcher):
+    """
+    Fetch annotated documents from PubTator Central.
+
+    With format="pubtator", the documents are requested
+    in the PubTator format; with format="biocxml", they
+    are requested in BioC XML, which includes full texts
+    where available if `full` is True.
+    Any further options (eg. `meta` or `byte_offsets`) are
+    passed on to PubTatorLoader or BioCXMLLoader.
+    See BatchFetcher for the batching, rate-limit and
+    cache options.
+    """
+
+    url = ('https://www.ncbi.nlm.nih.gov/research/pubtator3-api/'
+           'publications/export/{}')
+    name = 'pubtator'
+    # Unlike PubMed, no parse errors: a malformed response fails at once.
+    retry_errors = BatchFetcher.retry_errors
+
+    def __init__(self, format='pubtator', full=False, session=None,
+                 batch_size=100, workers=3, rate=None, batch_retries=2,
+                 cache=None, **options):
+        super().__init__(session=session, batch_size=batch_size,
+                         workers=workers, rate=rate,
+                         batch_retries=batch_retries, cache=cache)
+        if format == 'pubtator':
+            self._loader = PubTatorLoader(**options)
+        elif format == 'biocxml':
+            self._loader = BioCXMLLoader(**options)
+        else:
+            raise ValueError('unknown PubTator Central format: {!r}'
+                             .format(format))
+        self.format = format
+        self.full = full
+
+    def _request(self, docids):
+        query = {'pmids': ','.join(docids)}
+        if self.full:
+            query['full'] = 'true'
+        url = '{}?{}'.format(self.url.format(self.format),
+                             urllib.parse.urlencode(query))
+        return self.session.get(url, throttle=self.limiter.wait)
+
+    def _parse(self, stream, raw=False):
+        if self.format == 'pubtator':
+            with text_stream(stream) as f:
+                for lines in self._loader._split(f):
+                    doc = self._loader._document(lines, None)
+                    data = ''.join(lines).encode('utf8') if raw else None
+                    yield doc, data
+        else:
+            for node in self._loader._iterparse(stream):
+                doc = self._loader._document(node)
+                data = etree.tostring(node, with_tail=False) if raw else None
+                yield doc, data
+
+    def _from_raw(self, data):
+        if self.format == 'pubtator':
+            return self._loader._document(list(decode_lines(data)), None)
+        return self._loader._document(etree.fromstring(data))
+
+    def _cache_key(self, docid):
+        return '{}/{}{}/{}'.format(self.name, self.format,
+                                   '-full' if self.full else '',
+                                   self._normalize_id(docid))
@@ -12,8 +12,9 @@ import io
 import json
 
 from ._load import DocLoader, DocIterator
-from ._export import StreamFormatter
+from ._export import StreamFormatter, as_exportable
 from ..doc.document import Document
+from ..util.iterate import json_iterencode
 from ..util.stream import text_stream, basename
 
 
@@ -137,7 +138,7 @@ class TXTFormatter(StreamFormatter):
         self.sentence_split = sentence_split
 
     def write(self, content, stream):
-        stream.writelines(self._iter_text(content))
+        stream.writelines(self._iter_text(as_exportable(content)))
 
     def _iter_text(self, content):
         if self.sentence_split:
@@ -171,6 +172,7 @@ class TXTJSONFormatter(TXTFormatter):
     ext = 'json'
 
     def write(self, content, stream):
-        collection = [{'id': doc.id, 'text': ''.join(self._iter_text(doc))}
-                      for doc in content.units('document')]
-        json.dump(collection, stream)
+        # Stream the JSON array, encoding one document at a time.
+        collection = ({'id': doc.id, 'text': ''.join(self._iter_text(doc))}
+                      for doc in as_exportable(content).units('document'))
+        stream.writelines(json_iterencode(collection, indent=None))
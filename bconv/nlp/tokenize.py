@@ -5,44 +5,85 @@ Word tokenisation and sentence splitting.
 
 __author__ = "Lenz Furrer"
 
-__all__ = ['TOKENIZER']
+__all__ = ['TOKENIZER', 'Tokenizer']
 
 
+import threading
+
 from ..util.iterate import ngrams
 
 
 class Tokenizer:
     """
     Lazy wrapper for token and sentence splitting.
+
+    The wrapped objects are created on first access, which
+    is safe to happen concurrently from multiple threads.
+
+    If `thread_local` is True, each thread gets its own
+    instances of the wrapped objects, so that no state is
+    shared between threads.
+    Assigning a tokenizer object then affects the current
+    thread only.
     """
 
-    def __init__(self):
-        self._word_tokenizer = None
-        self._sentence_splitter = None
+    def __init__(self, thread_local=False):
+        self._lock = threading.Lock()
+        self._shared = _Slots()
+        self._local = threading.local()
+        self.thread_local = thread_local
+
+    def _slots(self):
+        if not self.thread_local:
+            return self._shared
+        try:
+            return self._local.slots
+        except AttributeError:
+            slots = self._local.slots = _Slots()
+            return slots
+
+    def _get(self, name, factory):
+        slots = self._slots()
+        obj = getattr(slots, name)
+        if obj is None:
+            # Double-checked locking: only one thread runs the factory
+            # (which might import NLTK), the others wait for the result.
+            with self._lock:
+                obj = getattr(slots, name)
+                if obj is None:
+                    obj = factory()
+                    setattr(slots, name, obj)
+        return obj
 
     @property
     def word_tokenizer(self):
         """Tokenizer object with a `span_tokenize` method."""
-        if self._word_tokenizer is None:
-            from nltk.tokenize import WordPunctTokenizer
-            self._word_tokenizer = WordPunctTokenizer()
-        return self._word_tokenizer
+        return self._get('word_tokenizer', self.new_word_tokenizer)
 
     @word_tokenizer.setter
     def word_tokenizer(self, tokenizer):
-        self._word_tokenizer = tokenizer
+        self._slots().word_tokenizer = tokenizer
 
     @property
     def sentence_splitter(self):
         """Sentence-splitter object with a `span_tokenize` method."""
-        if self._sentence_splitter is None:
-            from nltk.tokenize import PunktSentenceTokenizer
-            self._sentence_splitter = PunktSentenceTokenizer()
-        return self._sentence_splitter
+        return self._get('sentence_splitter', self.new_sentence_splitter)
 
     @sentence_splitter.setter
     def sentence_splitter(self, tokenizer):
-        self._sentence_splitter = tokenizer
+        self._slots().sentence_splitter = tokenizer
+
+    @staticmethod
+    def new_word_tokenizer():
+        """Create a default word-tokenizer object."""
+        from nltk.tokenize import WordPunctTokenizer
+        return WordPunctTokenizer()
+
+    @staticmethod
+    def new_sentence_splitter():
+        """Create a default sentence-splitter object."""
+        from nltk.tokenize import PunktSentenceTokenizer
+        return PunktSentenceTokenizer()
 
     def split_sentences(self, text, offset=0):
         """Iterate over sentence triples <text, start, end>."""
@@ -63,5 +104,17 @@ class Tokenizer:
             yield text[start:end], start+offset, end+offset
 
 
+class _Slots:
+    """Container for the wrapped objects."""
+
+    __slots__ = ('word_tokenizer', 'sentence_splitter')
+
+    def __init__(self):
+        self.word_tokenizer = None
+        self.sentence_splitter = None
+
+
 # Global default instance.
+# Set TOKENIZER.thread_local = True to avoid sharing the
+# NLTK objects between threads.
 TOKENIZER = Tokenizer()
@@ -0,0 +1,158 @@
+"""
+Persistent on-disk cache for binary records.
+"""
+
+
+__author__ = "Lenz Furrer"
+
+__all__ = ['DiskCache']
+
+
+import os
+import time
+import tempfile
+import threading
+import urllib.parse
+from pathlib import Path
+
+from .stream import ropen, wopen, compression_extension
+
+
+class DiskCache:
+    """
+    Directory of cached binary records, one file per key.
+
+    Keys are strings; slashes create subdirectories.
+    Records older than `ttl` seconds are treated as missing.
+    If the total size exceeds `max_size` bytes, the least
+    recently used records are deleted.
+    With `compression` ("gzip", "bz2", "xz" or "zstd"), the
+    records are stored in compressed form.
+
+    Records are written atomically, so a cache directory
+    can be shared between threads and processes.
+    The `hits` and `misses` counters track lookups.
+    """
+
+    def __init__(self, directory, ttl=None, max_size=None, compression=None):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.compression = compression
+        self._suffix = '' if compression is None else \
+            compression_extension(compression)
+        self._lock = threading.Lock()
+        self._added = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return '<{} at {}>'.format(type(self).__name__, self.directory)
+
+    def __contains__(self, key):
+        return self._fresh(self._path(key)) is not None
+
+    def get(self, key):
+        """Get a record as bytes, or None if missing or expired."""
+        path = self._path(key)
+        data = None
+        mtime = self._fresh(path)
+        if mtime is not None:
+            try:
+                with ropen(path, encoding=None,
+                           compression=self.compression) as f:
+                    data = f.read()
+                # Mark as recently used through the access time;
+                # the modification time is kept for the TTL.
+                os.utime(str(path), (time.time(), mtime))
+            except OSError:  # evicted concurrently
+                data = None
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """Store a record (bytes)."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=str(path.parent), suffix='.tmp')
+        os.close(fd)
+        try:
+            with wopen(tmp, encoding=None, compression=self.compression) as f:
+                f.write(data)
+            os.replace(tmp, str(path))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        if self.max_size is not None:
+            with self._lock:
+                self._added += len(data)
+                # Scanning the directory is expensive -- do it only
+                # after adding a substantial amount of data.
+                due = self._added > self.max_size // 10
+                if due:
+                    self._added = 0
+            if due:
+                self.evict()
+
+    def delete(self, key):
+        """Remove a record, if present."""
+        try:
+            os.unlink(str(self._path(key)))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Delete expired records and enforce the size limit."""
+        records = []
+        now = time.time()
+        for path in self.directory.rglob('*'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if not path.is_file() or path.suffix == '.tmp':
+                continue
+            if self.ttl is not None and now - stat.st_mtime > self.ttl:
+                self._unlink(path)
+            else:
+                records.append((stat.st_atime, stat.st_size, path))
+        if self.max_size is None:
+            return
+        total = sum(size for _, size, _ in records)
+        for _, size, path in sorted(records, key=lambda r: r[0]):
+            if total <= self.max_size:
+                break
+            self._unlink(path)
+            total -= size
+
+    def clear(self):
+        """Delete all records."""
+        for path in self.directory.rglob('*'):
+            if path.is_file():
+                self._unlink(path)
+
+    def _path(self, key):
+        parts = [urllib.parse.quote(p, safe='') for p in key.split('/')]
+        parts = [p if p.strip('.') else p.replace('.', '%2E') for p in parts]
+        parts[-1] += self._suffix
+        return self.directory.joinpath(*parts)
+
+    def _fresh(self, path):
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            return None
+        if self.ttl is not None and time.time() - mtime > self.ttl:
+            return None
+        return mtime
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            path.unlink()
+        except OSError:
+            pass
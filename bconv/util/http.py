@@ -0,0 +1,305 @@
+"""
+Pooled HTTP connections with retries.
+"""
+
+
+__author__ = "Lenz Furrer"
+
+__all__ = ['SESSION', 'Session', 'RateLimiter']
+
+
+import io
+import time
+import logging
+import threading
+import http.client
+import urllib.error
+import urllib.parse
+import urllib.request
+import email.utils
+from collections import defaultdict
+
+from .stream import decompress
+
+
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+REDIRECT_STATUS = frozenset({301, 302, 303, 307, 308})
+MAX_REDIRECTS = 10
+
+
+class Session:
+    """
+    Reusable HTTP(S) connections with retries and backoff.
+
+    Idle connections are kept open (HTTP keep-alive) and
+    reused for subsequent requests to the same host; at
+    most `pool_size` idle connections are kept per host.
+    A session can be shared between threads.
+
+    Requests failing with a connection error or with one
+    of the status codes in `retry_status` (429 Too Many
+    Requests and 5xx server errors by default) are repeated
+    up to `retries` times.
+    Before the n-th repetition, the session waits for
+    backoff * 2**(n-1) seconds (at most `max_backoff`),
+    or as long as the server asks for with a Retry-After
+    header.
+    Failures while reading a response body are not retried.
+
+    Response bodies are requested with gzip transfer
+    encoding and decompressed on the fly.
+    """
+
+    def __init__(self, pool_size=10, timeout=60, retries=3, backoff=0.5,
+                 max_backoff=60, retry_status=RETRY_STATUS, headers=None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_status = frozenset(retry_status)
+        self.headers = {'User-Agent': 'bconv', 'Accept-Encoding': 'gzip'}
+        if headers is not None:
+            self.headers.update(headers)
+        self._lock = threading.Lock()
+        self._idle = defaultdict(list)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle = [conn for conns in self._idle.values() for conn in conns]
+            self._idle.clear()
+        for conn in idle:
+            conn.close()
+
+    def get(self, url, **kwargs):
+        """Send a GET request. See open()."""
+        return self.open(url, **kwargs)
+
+    def post(self, url, data, **kwargs):
+        """Send a POST request. See open()."""
+        return self.open(url, data=data, **kwargs)
+
+    def open(self, url, data=None, headers=None, method=None, throttle=None):
+        """
+        Send a request and get a binary file-like response.
+
+        If `data` (bytes or a dict of form fields) is given,
+        the request method defaults to POST.
+        Redirects are followed.
+        If given, `throttle` is called without arguments
+        before each attempt (eg. RateLimiter.wait).
+
+        Raise urllib.error.HTTPError for error responses and
+        urllib.error.URLError for connection problems.
+        """
+        headers = {**self.headers, **(headers or {})}
+        if isinstance(data, dict):
+            data = urllib.parse.urlencode(data).encode('ascii')
+        if data is not None:
+            headers.setdefault(
+                'Content-Type', 'application/x-www-form-urlencoded')
+        if method is None:
+            method = 'GET' if data is None else 'POST'
+
+        for _ in range(MAX_REDIRECTS+1):
+            response = self._retrying(method, url, data, headers, throttle)
+            location = response.headers.get('Location')
+            if response.status not in REDIRECT_STATUS or location is None:
+                break
+            response.discard()
+            url = urllib.parse.urljoin(url, location)
+            if response.status == 303 or method == 'POST' and \
+                    response.status in (301, 302):
+                method, data = 'GET', None
+                headers.pop('Content-Type', None)
+        else:
+            response.discard()
+            raise urllib.error.HTTPError(
+                url, response.status, 'Too many redirects',
+                response.headers, None)
+
+        if response.status >= 400:
+            body = response.discard()
+            raise urllib.error.HTTPError(
+                url, response.status, response.reason,
+                response.headers, io.BytesIO(body))
+
+        f = io.BufferedReader(response)
+        if response.headers.get('Content-Encoding', '').lower() == 'gzip':
+            f = decompress(f, 'gzip', close_source=True)
+        return f
+
+    def _retrying(self, method, url, data, headers, throttle):
+        for attempt in range(self.retries+1):
+            last = attempt == self.retries
+            if throttle is not None:
+                throttle()
+            try:
+                response = self._send(method, url, data, headers)
+            except (OSError, http.client.HTTPException) as e:
+                if last:
+                    raise urllib.error.URLError(e) from e
+                delay = self._delay(attempt)
+                logging.info('%s %s failed (%s)', method, url, e)
+            else:
+                if response.status not in self.retry_status or last:
+                    return response
+                response.discard()
+                delay = self._delay(
+                    attempt, response.headers.get('Retry-After'))
+                logging.info('%s %s failed with status %d',
+                             method, url, response.status)
+            logging.info('retry in %.1f seconds', delay)
+            time.sleep(delay)
+
+    def _delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return max(0., float(retry_after))
+            except ValueError:
+                try:
+                    date = email.utils.parsedate_to_datetime(retry_after)
+                    return max(0., date.timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        return min(self.backoff * 2**attempt, self.max_backoff)
+
+    def _send(self, method, url, data, headers):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError('unsupported URL scheme: {}'.format(url))
+        key = parts.scheme, parts.hostname, parts.port
+        proxy = _proxy(parts.scheme, parts.hostname)
+        if proxy is not None and parts.scheme == 'http':
+            target = url  # absolute URL for forward proxies
+        else:
+            target = urllib.parse.urlunsplit(('', '', parts.path or '/',
+                                              parts.query, ''))
+        while True:
+            conn, reused = self._acquire(key, proxy)
+            try:
+                conn.request(method, target, body=data, headers=headers)
+                response = conn.getresponse()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                if reused:
+                    continue  # the server closed an idle connection
+                raise
+            return _Response(self, key, conn, response, url)
+
+    def _acquire(self, key, proxy):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._connect(*key, proxy=proxy), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle[key]
+            if len(idle) < self.pool_size:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _connect(self, scheme, host, port, proxy=None):
+        if scheme == 'https':
+            cls = http.client.HTTPSConnection
+        else:
+            cls = http.client.HTTPConnection
+        if proxy is None:
+            return cls(host, port, timeout=self.timeout)
+        proxy = urllib.parse.urlsplit(proxy)
+        conn = cls(proxy.hostname, proxy.port, timeout=self.timeout)
+        if scheme == 'https':
+            conn.set_tunnel(host, port)
+        return conn
+
+
+class _Response(io.RawIOBase):
+    """
+    Response body which returns the connection to the pool.
+    """
+
+    def __init__(self, session, key, conn, response, url):
+        super().__init__()
+        self._session = session
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    @property
+    def name(self):
+        """The request URL."""
+        return self.url
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self._response.readinto(b)
+
+    def discard(self):
+        """Read the rest of the body and close the response."""
+        try:
+            body = self._response.read()
+        except (OSError, http.client.HTTPException):
+            body = b''
+        self.close()
+        return body
+
+    def close(self):
+        if not self.closed:
+            # Only fully read responses leave the connection usable.
+            if self._response.isclosed() and not self._response.will_close:
+                self._session._release(self._key, self._conn)
+            else:
+                self._response.close()
+                self._conn.close()
+        super().close()
+
+
+class RateLimiter:
+    """
+    Space out events to at most `rate` per second.
+
+    Can be shared between threads.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self._lock = threading.Lock()
+        self._next = 0.
+
+    def wait(self):
+        """Block until the next event is allowed."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _proxy(scheme, host):
+    proxy = urllib.request.getproxies().get(scheme)
+    if proxy is None or urllib.request.proxy_bypass(host):
+        return None
+    return proxy
+
+
+# Global default session.
+# Change its attributes (eg. SESSION.retries = 5) to configure
+# HTTP access of all loaders and fetchers.
+SESSION = Session()
@@ -7,8 +7,11 @@ __author__ = "Lenz Furrer"
 
 
 import json
+import queue
+import threading
 import itertools as it
 from collections import deque
+from concurrent import futures
 from contextlib import contextmanager
 
 
@@ -28,6 +31,177 @@ def ngrams(iterable, n, pad_left=False, pad_right=False,
             yield tuple(window)
 
 
+def bounded_map(executor, func, iterable, ahead, ordered=True):
+    """
+    Like executor.map(), but submit only `ahead` tasks in advance.
+
+    Results are yielded in input order, or in order of
+    completion if `ordered` is False.
+    Unlike executor.map(), the input iterable is consumed
+    lazily, which keeps the memory footprint bounded.
+    """
+    pending = deque()
+    try:
+        for item in iterable:
+            if len(pending) >= ahead:
+                yield from _next_results(pending, ordered)
+            pending.append(executor.submit(func, item))
+        while pending:
+            yield from _next_results(pending, ordered)
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _next_results(pending, ordered):
+    if ordered:
+        yield pending.popleft().result()
+        return
+    done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+    for future in done:
+        pending.remove(future)
+    for future in done:
+        yield future.result()
+
+
+def iter_ahead(iterable, depth):
+    """
+    Iterate over `iterable` in a background thread.
+
+    Up to `depth` items are kept in a bounded queue, which
+    lets producing the items overlap with consuming them.
+    Errors are re-raised in the consuming thread.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+    end = object()
+
+    def _put(item):
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=.1)
+            except queue.Full:
+                continue
+            else:
+                break
+
+    def _fill():
+        try:
+            for item in iterable:
+                if stopped.is_set():
+                    return
+                _put((item, None))
+        except BaseException as e:  # pass any error on to the consumer
+            _put((end, e))
+        else:
+            _put((end, None))
+
+    thread = threading.Thread(target=_fill, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if error is not None:
+                raise error
+            if item is end:
+                break
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def fan_out(iterable, consumers, depth=16):
+    """
+    Feed the items of an iterable to multiple consumers.
+
+    Each consumer is a callable which takes an iterator over
+    all items; it runs in a separate thread.
+    The iterable is consumed once, in the calling thread,
+    and the consumers advance in lockstep: none of them lags
+    more than `depth` items behind.
+    Return a list of the consumers' return values.
+    If the iterable or any consumer fails, the others are
+    aborted (their iterator raises FanOutAborted) and the
+    error is re-raised.
+    """
+    feeds = [_Feed(depth) for _ in consumers]
+    results = [None] * len(consumers)
+    errors = []
+    failed = threading.Event()
+
+    def _run(i):
+        try:
+            results[i] = consumers[i](feeds[i])
+        except FanOutAborted:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            failed.set()
+        finally:
+            feeds[i].drain()  # never block the producer
+
+    threads = [threading.Thread(target=_run, args=(i,), daemon=True)
+               for i in range(len(consumers))]
+    for thread in threads:
+        thread.start()
+    end = _Feed.abort
+    try:
+        for item in iterable:
+            if failed.is_set():
+                break
+            for feed in feeds:
+                feed.put(item)
+        else:
+            end = _Feed.end
+    finally:
+        for feed in feeds:
+            feed.put(end)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+class FanOutAborted(Exception):
+    """Signal to consumers of fan_out() that another one failed."""
+
+
+class _Feed:
+    """Iterator over a bounded queue, which is closed by a sentinel."""
+
+    end = object()
+    abort = object()
+
+    def __init__(self, depth):
+        self._queue = queue.Queue(maxsize=depth)
+        self._done = False
+
+    def put(self, item):
+        self._queue.put(item)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        item = self._queue.get()
+        if item is self.end or item is self.abort:
+            self._done = True
+            if item is self.abort:
+                raise FanOutAborted()
+            raise StopIteration
+        return item
+
+    def drain(self):
+        """Discard any remaining items."""
+        while not self._done:
+            item = self._queue.get()
+            self._done = item is self.end or item is self.abort
+
+
 def pids(prefix, start=1):
     """
     Iterate over successive IDs with an arbitrary prefix.
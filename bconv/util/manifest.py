@@ -0,0 +1,135 @@
+"""
+Checkpoint records for resumable jobs.
+"""
+
+
+__author__ = "Lenz Furrer"
+
+__all__ = ['Manifest', 'file_checksum']
+
+
+import os
+import json
+import hashlib
+from pathlib import Path
+
+
+class Manifest:
+    """
+    Record of the completed units of a job.
+
+    The manifest is a JSON-lines file: a header describing
+    the job, followed by one line per completed unit (eg. an
+    input file or a range of documents) with its output file,
+    the SHA-256 checksum of the output, and any further
+    information (eg. the number of documents).
+    Each line is flushed to disk as soon as a unit is
+    recorded, so the record survives a crash.
+
+    A manifest created for a different `job` (a JSON-
+    serialisable description, eg. the formats) is rejected
+    with a ValueError.
+    """
+
+    version = 1
+
+    def __init__(self, path, job=None):
+        self.path = Path(path)
+        # Normalise through JSON for comparison (eg. tuples to lists).
+        self.job = json.loads(json.dumps(job))
+        self.units = {}
+        try:
+            with open(str(self.path), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            self._start()
+        else:
+            self._read(data)
+
+    def __repr__(self):
+        return '<{} at {}: {} units>'.format(
+            type(self).__name__, self.path, len(self.units))
+
+    def _start(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        header = {'version': self.version, 'job': self.job}
+        with open(str(self.path), 'w', encoding='utf8') as f:
+            self._write(f, header)
+
+    def _read(self, data):
+        # Drop an entry that was interrupted while being written.
+        complete = data[:data.rfind(b'\n')+1]
+        if not complete:  # interrupted before writing the header
+            self._start()
+            return
+        if len(complete) < len(data):
+            with open(str(self.path), 'r+b') as f:
+                f.truncate(len(complete))
+        lines = complete.decode('utf8').splitlines()
+        header = json.loads(lines[0])
+        if header.get('job') != self.job:
+            raise ValueError(
+                'manifest {} was created for a different job: {!r}'
+                .format(self.path, header.get('job')))
+        for line in lines[1:]:
+            entry = json.loads(line)
+            self.units[entry['key']] = entry
+
+    def completed(self, key, **info):
+        """
+        Look up a completed unit.
+
+        Return the recorded entry (a dict), or None if the
+        unit is missing, if any of the `info` items differ
+        from the record, or if the output file is missing or
+        has changed.
+        """
+        entry = self.units.get(key)
+        if entry is None:
+            return None
+        info = json.loads(json.dumps(info))
+        if any(entry.get(k) != v for k, v in info.items()):
+            return None
+        try:
+            checksum = file_checksum(self.output(entry))
+        except FileNotFoundError:
+            return None
+        return entry if checksum == entry['sha256'] else None
+
+    def output(self, entry):
+        """Path of the output file of an entry."""
+        return Path(self.path.parent, entry['output'])
+
+    def record(self, key, output, **info):
+        """
+        Record a unit as completed.
+
+        The output file must be complete, as its checksum is
+        computed now.
+        """
+        try:
+            relpath = os.path.relpath(str(output), str(self.path.parent))
+        except ValueError:  # different drives (Windows)
+            relpath = os.path.abspath(str(output))
+        entry = dict(info, key=key, output=relpath,
+                     sha256=file_checksum(output))
+        with open(str(self.path), 'a', encoding='utf8') as f:
+            self._write(f, entry)
+        self.units[key] = json.loads(json.dumps(entry))
+        return entry
+
+    @staticmethod
+    def _write(f, obj):
+        f.write(json.dumps(obj, sort_keys=True))
+        f.write('\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def file_checksum(path, chunk_size=2**20):
+    """Compute the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(str(path), 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
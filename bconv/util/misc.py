@@ -6,8 +6,13 @@ Miscellaneous utilities.
 __author__ = "Lenz Furrer"
 
 
+import re
+import abc
+import sys
 import time
+import bisect
 import codecs
+import itertools as it
 
 
 def timestamp():
@@ -15,6 +20,21 @@ def timestamp():
     return time.strftime('%Y%m%d-%H%M%S')
 
 
+def safe_filename(name, max_length=200):
+    """
+    Turn an arbitrary string into a portable file name.
+
+    Path separators and other problematic characters are
+    replaced with underscores, as is a leading dot.
+    The result may be empty.
+    """
+    name = re.sub(r'[\x00-\x1f/\\:*?"<>|]', '_', name or '')
+    name = name.strip().rstrip('.')[:max_length]
+    if name.startswith('.'):
+        name = '_' + name[1:]
+    return name
+
+
 # CSV flavour for reading and writing TSV files.
 # Treat every character literally (including quotes).
 tsv_format = dict(
@@ -40,19 +60,119 @@ def codepoint_indices(text, codec, text2bytes=True):
     The returned list has a length of `len(text)+1` or `len(octets)+1`,
     as it includes the end offset as well.
     """
+    info = codecs.lookup(codec)  # lookup: get canonical spelling
     # Use UTF-8 optimisation if applicable.
-    if codecs.lookup(codec).name == 'utf-8':  # lookup: get canonical spelling
+    if info.name == 'utf-8':
         if text2bytes:
-            indices = iter_codepoint_indices_utf8(text)
+            indices = codepoint_indices_utf8(text)
         else:
-            indices = iter_byte_indices_utf8(text)
+            indices = byte_indices_utf8(text)
+        return list(indices)
+
+    # Single-byte codecs: identity mapping.
+    if _is_single_byte(info):
+        text.encode(info.name)  # raise an error for unencodable text
+        return list(range(len(text)+1))
+
+    # UTF-16 and UTF-32: multiply (unless there are surrogate pairs).
+    width = _FIXED_WIDTHS.get(info.name)
+    if text and (width == 4 or width == 2 and not _ASTRAL.search(text)):
+        return _fixed_width_indices(text, info.name, width, text2bytes)
+
+    # Other stateless codecs: look up the width of each character.
+    if text and not info.name.startswith(_STATEFUL):
+        indices = _table_indices(text, info.name, text2bytes)
+        if indices is not None:
+            return indices
+
+    # Stateful codecs (and empty text): encode character by character.
+    if text2bytes:
+        indices = iter_codepoint_indices(text, codec)
     else:
-        if text2bytes:
-            indices = iter_codepoint_indices(text, codec)
-        else:
-            indices = iter_byte_indices(text, codec)
+        indices = iter_byte_indices(text, codec)
     return list(indices)
 
+
+def _is_single_byte(info):
+    if info.name in ('ascii', 'iso8859-1'):
+        return True
+    # Charmap codecs from the stdlib's encodings package use a lookup table
+    # for decoding, which maps each byte to a character.
+    module = sys.modules.get(getattr(info.encode, '__module__', None))
+    return len(getattr(module, 'decoding_table', ())) == 256
+
+
+def _fixed_width_indices(text, codec, width, text2bytes):
+    text.encode(codec)  # raise an error for unencodable text (surrogates)
+    n = len(text)
+    bom = len(''.encode(codec))
+    if text2bytes:
+        indices = [0]
+        indices.extend(range(width+bom, width*n+bom+1, width))
+    else:
+        indices = [0] * bom
+        indices.extend(it.chain.from_iterable(zip(*[range(n)]*width)))
+        indices.append(n)
+    return indices
+
+
+def _table_indices(text, codec, text2bytes):
+    """
+    Compute the indices from a table of character widths.
+
+    The table lookups run in bulk through the charmap codec,
+    which translates each character to the bytes given by
+    the table: its width (text to bytes), or a flag for
+    each of its bytes, marking the first one (bytes to text).
+    A BOM (if any) is counted towards the first character,
+    consistent with iter_codepoint_indices().
+    Return None if encoding characters in isolation doesn't
+    add up, which is the case for codecs with shift states.
+    """
+    total = len(text.encode(codec))  # also raises for unencodable text
+    bom = len(''.encode(codec))
+    if text2bytes:
+        table = _CharTable(codec, bom, lambda width: bytes((width,)))
+        widths = codecs.charmap_encode(text, 'strict', table)[0]
+        if sum(widths) + bom != total:
+            return None
+        indices = list(it.accumulate(it.chain(
+            (0, widths[0]+bom), memoryview(widths)[1:])))
+    else:
+        table = _CharTable(codec, bom, lambda width: b'\1' + bytes(width-1))
+        flags = codecs.charmap_encode(text, 'strict', table)[0]
+        if len(flags) + bom != total:
+            return None
+        flags = memoryview(flags[:1] + bytes(bom) + flags[1:])
+        indices = list(it.accumulate(it.chain((0,), flags[1:])))
+        indices.append(len(text))
+    return indices
+
+
+class _CharTable(dict):
+    """Charmap table filled on demand from each character's width."""
+
+    def __init__(self, codec, bom, entry):
+        super().__init__()
+        self._codec = codec
+        self._bom = bom
+        self._entry = entry
+
+    def __missing__(self, code):
+        width = len(chr(code).encode(self._codec)) - self._bom
+        if not 0 < width < 256:
+            raise ValueError('unexpected width: {}'.format(width))
+        entry = self[code] = self._entry(width)
+        return entry
+
+
+_FIXED_WIDTHS = {
+    'utf-16': 2, 'utf-16-le': 2, 'utf-16-be': 2,
+    'utf-32': 4, 'utf-32-le': 4, 'utf-32-be': 4,
+}
+_STATEFUL = ('iso2022', 'hz', 'utf-7')  # codecs with shift sequences
+_ASTRAL = re.compile('[\U00010000-\U0010FFFF]')
+
 def iter_codepoint_indices(text, codec):
     """
     Iterate over the byte offset of each character (any codec).
@@ -70,12 +190,22 @@ def iter_codepoint_indices_utf8(text):
     """
     Iterate over the byte offset of each character (UTF-8 only).
     """
+    return iter(codepoint_indices_utf8(text))
+
+def codepoint_indices_utf8(text):
+    """
+    Get a sequence of byte offsets for each character (UTF-8 only).
+
+    Depending on the input, the result is a range or a list.
+    """
+    if text.isascii():
+        return range(len(text)+1)
     octets = text.encode('utf-8')
-    for i, c in enumerate(octets):
-        # Enumerate all bytes, but omit the continuation bytes (10xxxxxx).
-        if not 0x80 <= c < 0xC0:
-            yield i
-    yield len(octets)
+    # Omit the continuation bytes (10xxxxxx).
+    flags = octets.translate(_UTF8_LEAD_BYTES)
+    indices = list(it.compress(range(len(octets)), flags))
+    indices.append(len(octets))
+    return indices
 
 def iter_byte_indices(text, codec):
     """
@@ -90,10 +220,110 @@ def iter_byte_indices_utf8(text):
     """
     Iterate over the codepoint offset of each byte (UTF-8 only).
     """
+    return iter(byte_indices_utf8(text))
+
+def byte_indices_utf8(text):
+    """
+    Get a sequence of codepoint offsets for each byte (UTF-8 only).
+
+    Depending on the input, the result is a range or a list.
+    """
+    if text.isascii():
+        return range(len(text)+1)
     octets = text.encode('utf-8')
-    i = -1
-    for c in octets:
-        if not 0x80 <= c < 0xC0:
-            i += 1
-        yield i
-    yield i+1  # == len(text)
+    # The first byte always starts a character, so the running count
+    # of lead bytes (starting at 0) is the codepoint offset.
+    flags = memoryview(octets.translate(_UTF8_LEAD_BYTES))
+    indices = list(it.accumulate(it.chain((0,), flags[1:])))
+    indices.append(len(text))
+    return indices
+
+
+class _SparseIndices(abc.ABC):
+    """
+    Sparse mapping between codepoint and UTF-8 byte offsets.
+
+    Only the positions of multibyte characters are stored,
+    so memory usage is proportional to the number of non-ASCII
+    characters rather than the text length.
+    Lookups are resolved by bisecting over these positions.
+    """
+
+    def __init__(self, text):
+        self._chars = []   # codepoint offset of each multibyte character
+        self._starts = []  # byte offset of each multibyte character
+        self._ends = []    # byte end offset of each multibyte character
+        extra = 0
+        for m in _NON_ASCII.finditer(text):
+            self._chars.append(m.start())
+            self._starts.append(m.start() + extra)
+            code = ord(m.group())
+            extra += 1 + (code >= 0x800) + (code >= 0x10000)
+            self._ends.append(m.end() + extra)
+        self._len_text = len(text)
+        self._len_bytes = len(text) + extra
+
+    @abc.abstractmethod
+    def __len__(self):
+        """Length of the sequence."""
+
+    def __getitem__(self, index):
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError('index out of range')
+        return self._lookup(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._lookup(i)
+
+    @abc.abstractmethod
+    def _lookup(self, index):
+        """Get the value at a non-negative index."""
+
+
+class SparseCodepointIndices(_SparseIndices):
+    """
+    Sparse sequence of byte offsets for each character (UTF-8 only).
+
+    Equivalent to codepoint_indices_utf8(text).
+    """
+
+    def __len__(self):
+        return self._len_text + 1
+
+    def _lookup(self, index):
+        # Find the last multibyte character before this one.
+        k = bisect.bisect_left(self._chars, index) - 1
+        if k < 0:
+            return index
+        return self._ends[k] + index - self._chars[k] - 1
+
+
+class SparseByteIndices(_SparseIndices):
+    """
+    Sparse sequence of codepoint offsets for each byte (UTF-8 only).
+
+    Equivalent to byte_indices_utf8(text).
+    """
+
+    def __len__(self):
+        return self._len_bytes + 1
+
+    def _lookup(self, index):
+        # Find the last multibyte character starting at or before this byte.
+        k = bisect.bisect_right(self._starts, index) - 1
+        if k < 0:
+            return index
+        if index < self._ends[k]:
+            return self._chars[k]
+        return self._chars[k] + 1 + index - self._ends[k]
+
+
+_NON_ASCII = re.compile(r'[^\x00-\x7f]')
+
+# Translation table for flagging bytes that start a UTF-8 character.
+_UTF8_LEAD_BYTES = bytes(0 if 0x80 <= b < 0xC0 else 1 for b in range(256))
+
@@ -8,30 +8,76 @@ __author__ = "Lenz Furrer"
 
 import io
 import os
+import re
+import bz2
+import mmap
+import gzip
+import lzma
+import queue
 import codecs
-import urllib.request
+import threading
 from pathlib import Path
+from contextlib import contextmanager
 
 
-REMOTE_PROTOCOLS = ('http://', 'https://', 'ftp://')
+HTTP_PROTOCOLS = ('http://', 'https://')
+REMOTE_PROTOCOLS = HTTP_PROTOCOLS + ('ftp://',)
 try:
     PATHLIKE = os.PathLike  # type: type
 except AttributeError:  # Python < 3.6
     PATHLIKE = Path
 
+# Compression formats: file suffix and magic bytes.
+COMPRESSION_SUFFIXES = {
+    '.gz': 'gzip',
+    '.bz2': 'bz2',
+    '.xz': 'xz',
+    '.zst': 'zstd',
+}
+COMPRESSION_MAGIC = (
+    (re.compile(rb'\x1f\x8b'), 'gzip'),
+    # "BZh" alone is plain text: require the block size and the magic
+    # number of the first block (or of the end of an empty stream).
+    (re.compile(rb'BZh[1-9](?:1AY&SY|\x17rE8P\x90)'), 'bz2'),
+    (re.compile(rb'\xfd7zXZ\x00'), 'xz'),
+    (re.compile(rb'\x28\xb5\x2f\xfd'), 'zstd'),
+)
+_MAGIC_LENGTH = 10  # bytes needed for matching COMPRESSION_MAGIC
 
-def ropen(locator, encoding='utf-8', **kwargs):
+
+def ropen(locator, encoding='utf-8', compression='infer', session=None,
+          **kwargs):
     """
     Open a local or remote file for reading.
+
+    HTTP(S) URLs are requested through `session`, which
+    defaults to the global bconv.util.http.SESSION.
+
+    Compressed content is decompressed on the fly.
+    With compression="infer", the compression format
+    is determined from the magic bytes or the file suffix.
+    Use compression=None to disable decompression.
+
+    Any kwargs are passed on to io.TextIOWrapper
+    (ignored for binary mode, ie. encoding=None).
     """
+    kwargs.pop('mode', None)  # always read bytes first
     if isinstance(locator, PATHLIKE):
-        f = locator.open(encoding=encoding, **kwargs)
+        locator = os.fspath(locator)
+    if locator.startswith(HTTP_PROTOCOLS):
+        if session is None:
+            from .http import SESSION as session
+        f = session.get(locator)
     elif locator.startswith(REMOTE_PROTOCOLS):
+        import urllib.request
         f = urllib.request.urlopen(locator)
-        if encoding is not None:
-            f = codecs.getreader(encoding)(f)
     else:
-        f = open(locator, encoding=encoding, **kwargs)
+        f = open(locator, mode='rb')
+    if compression == 'infer':
+        compression = sniff_compression(f, default=compression_suffix(locator))
+    f = decompress(f, compression, close_source=True)
+    if encoding is not None:
+        f = io.TextIOWrapper(f, encoding=encoding, **kwargs)
     return f
 
 
@@ -43,6 +89,7 @@ def text_stream(source, encoding='utf-8', **kwargs):
     if hasattr(source, 'read'):
         # Check if this stream needs decoding.
         if isinstance(source, (io.RawIOBase, io.BufferedIOBase)):
+            source = decompress(source, kwargs.get('compression', 'infer'))
             source = codecs.getreader(encoding)(source)
         return source
     # Source is a path/URL.
@@ -56,8 +103,421 @@ def bin_stream(source, **kwargs):
     if hasattr(source, 'read'):
         if isinstance(source, io.TextIOBase):
             source = source.buffer
-        return source
-    return ropen(source, encoding=None, mode='rb', **kwargs)
+        return decompress(source, kwargs.get('compression', 'infer'))
+    return ropen(source, encoding=None, **kwargs)
+
+
+def decompress(stream, compression='infer', close_source=False):
+    """
+    Wrap a binary stream for on-the-fly decompression.
+
+    The compression format can be "gzip", "bz2", "xz", "zstd"
+    (requires the `zstandard` package or Python 3.14+), or None
+    (no decompression).
+    With "infer", the stream is checked for a known signature
+    (magic bytes); unknown content is returned unchanged.
+
+    If close_source is True, closing the returned stream
+    also closes the wrapped stream.
+    """
+    if compression == 'infer':
+        compression = sniff_compression(stream)
+    if compression is None:
+        return stream
+    if compression == 'gzip':
+        f = gzip.GzipFile(fileobj=stream, mode='rb')
+    elif compression == 'bz2':
+        f = bz2.BZ2File(stream, mode='rb')
+    elif compression == 'xz':
+        f = lzma.LZMAFile(stream, mode='rb')
+    elif compression == 'zstd':
+        f = _zstd_reader(stream)
+    else:
+        raise ValueError('unknown compression: {!r}'.format(compression))
+    if close_source:
+        f = _ClosingWrapper(f, stream)
+    return f
+
+
+def sniff_compression(stream, default=None):
+    """
+    Check the magic bytes of a binary stream without consuming them.
+
+    Return the compression format or None.
+    If the stream doesn't allow looking ahead, return `default`.
+    """
+    head = _peek(stream, _MAGIC_LENGTH)
+    if not head:
+        return default
+    for magic, compression in COMPRESSION_MAGIC:
+        if magic.match(head):
+            return compression
+    return None
+
+
+def compression_suffix(path):
+    """
+    Get the compression format from the file suffix (or None).
+    """
+    if isinstance(path, PATHLIKE):
+        path = os.fspath(path)
+    if not isinstance(path, str):
+        return None
+    suffix = os.path.splitext(path.split('?', 1)[0])[1].lower()
+    return COMPRESSION_SUFFIXES.get(suffix)
+
+
+def strip_compression_suffix(path):
+    """
+    Remove a suffix like ".gz" from a path (Path object).
+    """
+    if path.suffix.lower() in COMPRESSION_SUFFIXES:
+        path = path.with_suffix('')
+    return path
+
+
+def _peek(stream, n):
+    try:
+        return stream.peek(n)[:n]
+    except (AttributeError, io.UnsupportedOperation):
+        pass
+    try:
+        if stream.seekable():
+            pos = stream.tell()
+            head = stream.read(n)
+            stream.seek(pos)
+            return head
+    except (AttributeError, OSError):
+        pass
+    return b''  # cannot look ahead -- don't guess
+
+
+def _zstd_reader(stream):
+    try:
+        from compression import zstd  # Python 3.14+
+    except ImportError:
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError('zstd decompression requires the '
+                             '`zstandard` package')
+        reader = zstandard.ZstdDecompressor().stream_reader(stream)
+        return io.BufferedReader(reader)
+    return zstd.ZstdFile(stream, mode='rb')
+
+
+class _ClosingWrapper(io.BufferedReader):
+    """
+    Decompressing reader which also closes the underlying stream.
+    """
+
+    def __init__(self, reader, source):
+        super().__init__(reader)
+        self._source = source
+        name = getattr(source, 'name', getattr(source, 'url', None))
+        if isinstance(name, str):
+            self._name = name
+
+    @property
+    def name(self):
+        try:
+            return self._name
+        except AttributeError:
+            raise AttributeError('name')
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._source.close()
+
+
+def wopen(path, encoding='utf-8', compression='infer', **kwargs):
+    """
+    Open a local file for writing.
+
+    With compression="infer", the output is compressed if
+    the file suffix indicates a compression format (eg. ".gz").
+    Otherwise, `compression` can be "gzip", "bz2", "xz", "zstd",
+    or None (no compression).
+
+    For text mode (encoding is not None), any kwargs are
+    passed on to io.TextIOWrapper.
+    """
+    if compression == 'infer':
+        compression = compression_suffix(path)
+    if compression is None:
+        f = open(path, mode='wb')
+    else:
+        f = _compressor(path, compression)
+    if encoding is not None:
+        f = io.TextIOWrapper(f, encoding=encoding, **kwargs)
+    return f
+
+
+@contextmanager
+def atomic_wopen(path, encoding='utf-8', compression='infer', **kwargs):
+    """
+    Open a local file for writing, which appears only when complete.
+
+    The data are written to a hidden temporary file in the
+    same directory, which replaces `path` on success and is
+    removed on failure.
+    See wopen() for the other parameters.
+    """
+    path = os.fspath(path)
+    if compression == 'infer':
+        compression = compression_suffix(path)
+    head, tail = os.path.split(path)
+    tmp = os.path.join(head, '.{}.{}-{}.part'.format(
+        tail, os.getpid(), threading.get_ident()))
+    try:
+        with wopen(tmp, encoding, compression, **kwargs) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def compress(stream, compression):
+    """
+    Wrap a binary stream for on-the-fly compression.
+
+    Closing the returned stream finishes the compressed data,
+    but leaves the wrapped stream open.
+    """
+    if compression is None:
+        return stream
+    return _compressor(stream, compression)
+
+
+def _compressor(target, compression):
+    """Open a path or wrap a stream (which is not closed eventually)."""
+    if compression == 'gzip':
+        if hasattr(target, 'write'):
+            f = gzip.GzipFile(fileobj=target, mode='wb')
+        else:
+            f = gzip.open(target, mode='wb')
+    elif compression == 'bz2':
+        f = bz2.BZ2File(target, mode='wb')
+    elif compression == 'xz':
+        f = lzma.LZMAFile(target, mode='wb')
+    elif compression == 'zstd':
+        f = _zstd_writer(target)
+    else:
+        raise ValueError('unknown compression: {!r}'.format(compression))
+    return _CompressingWriter(f)
+
+
+class _CompressingWriter(io.BufferedWriter):
+    """
+    Buffered, strictly sequential writer for compressed output.
+
+    Compressors don't support seeking backwards, which is
+    signaled to clients like zipfile through seekable().
+    """
+
+    def seekable(self):
+        return False
+
+    def seek(self, *_):
+        raise io.UnsupportedOperation('seek')
+
+
+def compression_extension(compression):
+    """
+    Get the file suffix for this compression format (eg. ".gz").
+    """
+    for suffix, name in COMPRESSION_SUFFIXES.items():
+        if name == compression:
+            return suffix
+    raise ValueError('unknown compression: {!r}'.format(compression))
+
+
+def _zstd_writer(target):
+    try:
+        from compression import zstd  # Python 3.14+
+    except ImportError:
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError('zstd compression requires the '
+                             '`zstandard` package')
+        if hasattr(target, 'write'):
+            return zstandard.ZstdCompressor().stream_writer(target,
+                                                            closefd=False)
+        return zstandard.open(target, mode='wb')
+    return zstd.ZstdFile(target, mode='wb')
+
+
+def read_ahead(source, depth=16, chunk_size=2**18, **kwargs):
+    """
+    Open a binary stream which is filled by a background thread.
+
+    Reading and decompressing `source` (path, URL, or open
+    file) is done in a separate thread, which keeps up to
+    `depth` chunks of `chunk_size` bytes in a bounded queue.
+    This allows I/O to overlap with parsing.
+    """
+    return io.BufferedReader(ReadAheadReader(bin_stream(source, **kwargs),
+                                             depth, chunk_size))
+
+
+class ReadAheadReader(io.RawIOBase):
+    """
+    Raw binary stream reading from another stream in the background.
+    """
+
+    def __init__(self, stream, depth=16, chunk_size=2**18):
+        super().__init__()
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._queue = queue.Queue(maxsize=depth)
+        self._current = memoryview(b'')
+        self._eof = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    @property
+    def name(self):
+        """Name of the underlying stream."""
+        return self._stream.name
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self._current:
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, BaseException):
+                self._eof = True
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._current = memoryview(item)
+        n = min(len(b), len(self._current))
+        b[:n] = self._current[:n]
+        self._current = self._current[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stopped.set()
+            # Unblock the background thread, if it is waiting for space.
+            try:
+                while True:
+                    self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._thread.join()
+            self._stream.close()
+        super().close()
+
+    def _fill(self):
+        try:
+            while not self._stopped.is_set():
+                chunk = self._stream.read(self._chunk_size)
+                self._put(chunk)
+                if not chunk:
+                    break
+        except BaseException as e:  # pass any error on to the consumer
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=.1)
+            except queue.Full:
+                continue
+            else:
+                break
+
+
+def local_path(source):
+    """
+    Get the path of an uncompressed local file, or None.
+
+    Return None for streams, URLs, and compressed files.
+    """
+    if isinstance(source, PATHLIKE):
+        source = os.fspath(source)
+    if not isinstance(source, str) or source.startswith(REMOTE_PROTOCOLS):
+        return None
+    try:
+        with open(source, mode='rb') as f:
+            if sniff_compression(f, default=compression_suffix(source)):
+                return None
+    except OSError:
+        return None
+    return source
+
+
+@contextmanager
+def mapped(path):
+    """
+    Memory-map a local file for reading.
+    """
+    with open(path, mode='rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''  # empty files cannot be mapped
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield buffer
+
+
+def iter_ranges(buffer, boundary, start=0, end=None):
+    """
+    Split a bytes-like object at document boundaries.
+
+    Iterate over <start, end> byte offsets.
+    The slices are cut at the end of each match of the
+    compiled regex `boundary`.
+    """
+    if end is None:
+        end = len(buffer)
+    for match in boundary.finditer(buffer, start, end):
+        if match.end() > start:
+            yield start, match.end()
+            start = match.end()
+    if start < end:
+        yield start, end
+
+
+def iter_chunks(buffer, boundary, size, start=0, end=None):
+    """
+    Split a bytes-like object into chunks of about `size` bytes.
+
+    Iterate over <start, end> byte offsets.
+    Each chunk extends to the end of the first match of the
+    compiled regex `boundary` after `size` bytes, so only
+    few boundaries need to be located.
+    """
+    if end is None:
+        end = len(buffer)
+    while start < end:
+        match = None
+        if start + size < end:
+            match = boundary.search(buffer, start + size, end)
+        cut = end if match is None else match.end()
+        yield start, cut
+        start = cut
+
+
+def decode_lines(data, encoding='utf-8'):
+    """
+    Decode bytes into an iterator of lines.
+
+    Line endings are normalised like in text-mode files.
+    """
+    return io.StringIO(str(data, encoding), newline=None)
 
 
 def basename(source):
@@ -69,5 +529,5 @@ def basename(source):
     if isinstance(source, str):
         source = Path(source)
     if isinstance(source, PATHLIKE):
-        return source.stem
+        return strip_compression_suffix(Path(source)).stem
     return None
@@ -0,0 +1,92 @@
+"""
+Benchmark end-to-end conversion with bconv.convert().
+
+Large PubTator and PubMed XML files are generated by
+replicating the test files. They are converted to BioC XML
+and CoNLL, respectively, with different numbers of worker
+processes (0 means conversion in the calling process).
+Throughput and peak memory are reported for each run; since
+peak memory is a process-lifetime maximum (which survives
+fork/exec on Linux), both generating the input and each run
+are executed in fresh subprocesses.
+
+Usage:
+    python benchmarks/bench_convert.py [--copies N] [--workers N ...]
+"""
+
+
+__author__ = "Lenz Furrer"
+
+
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lxml import etree
+
+
+DATA = Path(__file__).parent.parent / 'test' / 'data'
+
+TASKS = [
+    ('pubtator', 'bioc_xml'),
+    ('pxml', 'conll'),
+]
+
+
+def main():
+    """Run the benchmark."""
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    ap.add_argument('--copies', type=int, default=200,
+                    help='replications of the test files '
+                         '(default: %(default)s)')
+    ap.add_argument('--workers', type=int, nargs='+',
+                    default=sorted({0, 2, os.cpu_count() or 1}),
+                    help='numbers of worker processes (default: %(default)s)')
+    ap.add_argument('--generate', nargs=2, metavar=('FMT', 'PATH'),
+                    help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.generate:
+        fmt, path = args.generate
+        Path(path).write_bytes(_generate(fmt, args.copies))
+        return
+
+    print('{} CPUs'.format(os.cpu_count()))
+    with tempfile.TemporaryDirectory() as tmp:
+        for src_fmt, dest_fmt in TASKS:
+            source = Path(tmp, src_fmt)
+            subprocess.run([sys.executable, __file__, '--copies',
+                            str(args.copies), '--generate', src_fmt,
+                            str(source)], check=True)
+            print('{} -> {} ({:.1f} MB)'.format(
+                src_fmt, dest_fmt, source.stat().st_size / 2**20))
+            for n in args.workers:
+                dest = Path(tmp, dest_fmt)
+                script = ('import bconv; print(bconv.convert({!r}, {!r}, {!r}, '
+                          '{!r}, workers={}))'
+                          .format(str(source), src_fmt, str(dest), dest_fmt, n))
+                result = subprocess.run(
+                    [sys.executable, '-c', script], check=True,
+                    stdout=subprocess.PIPE, universal_newlines=True,
+                    cwd=str(Path(__file__).parent.parent))
+                print('  workers={:<3} {}'.format(n, result.stdout.strip()))
+
+
+def _generate(fmt, copies):
+    if fmt == 'pxml':
+        path = DATA / 'pubmed' / 'NCBIdevset-example.pxml'
+        articles = etree.parse(str(path)).getroot().findall('PubmedArticle')
+        data = b''.join(map(etree.tostring, articles)) * copies
+        return b'<PubmedArticleSet>' + data + b'</PubmedArticleSet>'
+    docs = [p.read_bytes().strip() + b'\n\n'
+            for p in sorted(DATA.joinpath(fmt).glob('*'))]
+    return b''.join(docs) * copies
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark the import time of bconv.
+
+`import bconv` is run in fresh interpreters with
+`python -X importtime`, and the median cumulative time
+is compared to a budget (exit status 1 if exceeded).
+The slowest imports are listed, as well as the extra
+time for the first lookup of some formats.
+
+Usage:
+    python benchmarks/bench_import.py [--runs N] [--budget MS] [--top N]
+"""
+
+
+__author__ = "Lenz Furrer"
+
+
+import sys
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+
+ROOT = Path(__file__).parent.parent
+
+LOOKUPS = [
+    "bconv.LOADERS['pubtator']",
+    "bconv.LOADERS['bioc_xml']",
+    "bconv.EXPORTERS['conll']",
+    "bconv.FETCHERS['pubmed']",
+]
+
+
+def main():
+    """Run the benchmark."""
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    ap.add_argument('--runs', type=int, default=10,
+                    help='number of interpreter runs (default: %(default)s)')
+    ap.add_argument('--budget', type=float, default=75,
+                    help='maximum median import time in ms '
+                         '(default: %(default)s)')
+    ap.add_argument('--top', type=int, default=10,
+                    help='number of slowest imports to list '
+                         '(default: %(default)s)')
+    args = ap.parse_args()
+
+    runs = [_importtime('import bconv') for _ in range(args.runs)]
+    base = statistics.median(_total(run) for run in runs)
+    total = statistics.median(_cumulative(run, 'bconv') for run in runs)
+    print('import bconv: {:.1f} ms (median of {} runs)'
+          .format(total, args.runs))
+    print('slowest modules (self ms):')
+    top = sorted(runs[-1], key=lambda x: -x[1])[:args.top]
+    for name, self_ms, _, _ in top:
+        print('  {:<40} {:6.1f}'.format(name, self_ms))
+
+    print('first lookup (extra ms):')
+    for lookup in LOOKUPS:
+        times = [_importtime('import bconv; ' + lookup)
+                 for _ in range(args.runs)]
+        extra = statistics.median(_total(t) for t in times) - base
+        print('  {:<40} {:6.1f}'.format(lookup, max(extra, 0)))
+
+    if total > args.budget:
+        print('over budget ({:.0f} ms)'.format(args.budget))
+        sys.exit(1)
+
+
+def _importtime(script):
+    """Get <name, self ms, cumulative ms, nesting level> per import."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', script],
+        check=True, stderr=subprocess.PIPE, universal_newlines=True,
+        cwd=str(ROOT))
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        times.append((name.strip(), int(self_us) / 1000,
+                      int(cumulative) / 1000, level))
+    return times
+
+
+def _total(times):
+    return sum(cum for _, _, cum, level in times if level == 0)
+
+
+def _cumulative(times, module):
+    return next(cum for name, _, cum, _ in times if name == module)
+
+
+if __name__ == '__main__':
+    main()
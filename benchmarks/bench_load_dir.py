@@ -0,0 +1,89 @@
+"""
+Benchmark directory-wise loading of many PubMed XML files.
+
+A directory of single-article PubMed XML files is generated
+from a test file. It is loaded with a serial loop over
+bconv.load() and with bconv.load_dir() for different numbers
+of worker processes.
+
+Usage:
+    python benchmarks/bench_load_dir.py [--files N] [--workers N ...]
+                                        [--chunksize N]
+"""
+
+
+__author__ = "Lenz Furrer"
+
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lxml import etree
+
+import bconv
+
+
+DATA = Path(__file__).parent.parent / 'test' / 'data'
+
+
+def main():
+    """Run the benchmark."""
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    ap.add_argument('--files', type=int, default=10000,
+                    help='number of files (default: %(default)s)')
+    ap.add_argument('--workers', type=int, nargs='+',
+                    default=sorted({1, 2, 4, os.cpu_count() or 1}),
+                    help='numbers of worker processes (default: %(default)s)')
+    ap.add_argument('--chunksize', type=int, default=16,
+                    help='files per worker task (default: %(default)s)')
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _generate(Path(tmp), args.files)
+        print('{} files, {} CPUs'.format(args.files, os.cpu_count()))
+        _report('serial loop', _serial, tmp)
+        for n in args.workers:
+            for chunksize in sorted({1, args.chunksize}):
+                for ordered in (True, False):
+                    label = 'load_dir(workers={}, chunksize={}, ordered={})' \
+                        .format(n, chunksize, ordered)
+                    _report(label, _parallel, tmp, n, chunksize, ordered)
+
+
+def _generate(target, n):
+    path = DATA / 'pubmed' / 'NCBIdevset-example.pxml'
+    articles = etree.parse(str(path)).getroot().findall('PubmedArticle')
+    for i in range(n):
+        article = articles[i % len(articles)]
+        article.find('.//PMID').text = str(10**7 + i)
+        data = b''.join((b'<PubmedArticleSet>',
+                         etree.tostring(article),
+                         b'</PubmedArticleSet>'))
+        (target / '{:06}.pxml'.format(i)).write_bytes(data)
+
+
+def _serial(directory):
+    for path in sorted(Path(directory).glob('*')):
+        yield from bconv.load(path, 'pxml', mode='lazy')
+
+
+def _parallel(directory, workers, chunksize, ordered):
+    return bconv.load_dir(directory, 'pxml', workers=workers,
+                          chunksize=chunksize, ordered=ordered)
+
+
+def _report(label, loader, *args):
+    start = time.perf_counter()
+    n = sum(1 for _ in loader(*args))
+    elapsed = time.perf_counter() - start
+    print('{:<52} {:7.2f} s  {:8.0f} docs/s'.format(label, elapsed, n/elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark codepoint/byte offset conversion per codec.
+
+Compares bconv.util.misc.codepoint_indices() to the character-wise
+reference implementation (iter_codepoint_indices/iter_byte_indices).
+
+Usage:
+    python benchmarks/bench_offsets.py [--size CHARS] [--repeat N]
+"""
+
+
+__author__ = "Lenz Furrer"
+
+
+import sys
+import timeit
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bconv.util import misc
+
+
+SAMPLES = {
+    'ascii': 'Mutations in the BRCA1 gene increase the risk of cancer. ',
+    'latin': 'Les mutations du gène BRCA1 augmentent le risque. ',
+    'greek': 'The α-synuclein and β-amyloid aggregates (≥ 5 µm). ',
+    'cjk': '乳腺癌 BRCA1 遺伝子の変異は癌のリスクを高める。',
+}
+
+CODECS = [
+    ('utf-8', 'ascii'),
+    ('utf-8', 'greek'),
+    ('latin-1', 'latin'),
+    ('cp1252', 'latin'),
+    ('utf-16', 'greek'),
+    ('utf-16-le', 'cjk'),
+    ('utf-32', 'greek'),
+    ('shift_jis', 'cjk'),
+    ('gb18030', 'greek'),
+]
+
+
+def main():
+    """Run the benchmark."""
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    ap.add_argument('--size', type=int, default=100000,
+                    help='text length in characters (default: %(default)s)')
+    ap.add_argument('--repeat', type=int, default=5,
+                    help='number of timed runs (default: %(default)s)')
+    args = ap.parse_args()
+
+    row = '{:<10} {:<6} {:<10} {:>10} {:>10} {:>8}'
+    print(row.format('codec', 'text', 'direction', 'reference', 'fast', 'speedup'))
+    for codec, sample in CODECS:
+        text = (SAMPLES[sample] * (args.size//len(SAMPLES[sample]) + 1))
+        text = text[:args.size]
+        for text2bytes, reference in ((True, misc.iter_codepoint_indices),
+                                      (False, misc.iter_byte_indices)):
+            ref = _time(lambda: list(reference(text, codec)), args.repeat)
+            fast = _time(lambda: misc.codepoint_indices(text, codec, text2bytes),
+                         args.repeat)
+            direction = 'text2bytes' if text2bytes else 'bytes2text'
+            print(row.format(codec, sample, direction,
+                             '{:.4f}s'.format(ref), '{:.4f}s'.format(fast),
+                             '{:.1f}x'.format(ref/fast)))
+
+
+def _time(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+if __name__ == '__main__':
+    main()
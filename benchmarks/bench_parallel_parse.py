@@ -0,0 +1,83 @@
+"""
+Benchmark intra-file parallel parsing of PubTator, CoNLL and BioC XML.
+
+A large file is generated by replicating the test files.
+It is loaded lazily with different numbers of workers
+(0 means serial parsing in the calling process).
+
+Usage:
+    python benchmarks/bench_parallel_parse.py [--copies N] [--workers N ...]
+"""
+
+
+__author__ = "Lenz Furrer"
+
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lxml import etree
+
+import bconv
+
+
+DATA = Path(__file__).parent.parent / 'test' / 'data'
+
+
+def main():
+    """Run the benchmark."""
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    ap.add_argument('--copies', type=int, default=500,
+                    help='replications of the test files '
+                         '(default: %(default)s)')
+    ap.add_argument('--workers', type=int, nargs='+',
+                    default=sorted({0, 1, 2, 4, os.cpu_count() or 1}),
+                    help='numbers of worker processes (default: %(default)s)')
+    ap.add_argument('--chunk-size', type=int, default=2**22,
+                    help='bytes per chunk (default: %(default)s)')
+    args = ap.parse_args()
+
+    print('{} CPUs'.format(os.cpu_count()))
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in ('pubtator', 'conll', 'bioc_xml'):
+            path = Path(tmp, fmt)
+            path.write_bytes(_generate(fmt, args.copies))
+            print('{}: {:.1f} MB'.format(fmt, path.stat().st_size / 2**20))
+            for n in args.workers:
+                start = time.perf_counter()
+                docs = bconv.load(path, fmt, mode='lazy', workers=n,
+                                  chunk_size=args.chunk_size)
+                count = sum(1 for _ in docs)
+                elapsed = time.perf_counter() - start
+                print('  workers={:<3} {:7.2f} s  {:8.0f} docs/s'
+                      .format(n, elapsed, count/elapsed))
+
+
+def _generate(fmt, copies):
+    docs = []
+    for i, path in enumerate(sorted(DATA.joinpath(fmt).glob('*'))):
+        if fmt == 'conll':
+            docs.append(b'# doc_id = %d\n' % i + path.read_bytes())
+        elif fmt == 'bioc_xml':
+            docs.extend(etree.tostring(d) for d in
+                        etree.parse(str(path)).iterfind('document'))
+        else:
+            docs.append(path.read_bytes().strip() + b'\n\n')
+    data = b''.join(docs) * copies
+    if fmt == 'bioc_xml':
+        data = b''.join((b'<?xml version="1.0" encoding="UTF-8"?>\n',
+                         b'<collection><source>bench</source>',
+                         b'<date></date><key></key>',
+                         data,
+                         b'</collection>\n'))
+    return data
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark background read-ahead on gzipped input from a slow disk.
+
+A gzipped PubTator or BioC XML corpus is generated by replicating
+a test file; the disk is simulated by a reader with a fixed
+throughput. The corpus is loaded lazily with and without the
+`readahead` option of bconv.load().
+
+Usage:
+    python benchmarks/bench_readahead.py [--docs N] [--mbps MB/s]
+"""
+
+
+__author__ = "Lenz Furrer"
+
+
+import io
+import sys
+import gzip
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import bconv
+
+
+DATA = Path(__file__).parent.parent / 'test' / 'data'
+
+
+class SlowDisk(io.RawIOBase):
+    """Binary stream with limited throughput."""
+
+    def __init__(self, data, mbps):
+        super().__init__()
+        self._data = io.BytesIO(data)
+        self._delay = 1 / (mbps * 2**20)  # seconds per byte
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self._data.readinto(b)
+        time.sleep(n * self._delay)
+        return n
+
+
+def main():
+    """Run the benchmark."""
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    ap.add_argument('--docs', type=int, default=2000,
+                    help='number of documents (default: %(default)s)')
+    ap.add_argument('--mbps', type=float, default=1,
+                    help='disk throughput in MB/s (default: %(default)s)')
+    args = ap.parse_args()
+
+    for fmt, data in (('pubtator', _pubtator(args.docs)),
+                      ('bioc_xml', _bioc(args.docs))):
+        data = gzip.compress(data)
+        for readahead in (None, 16):
+            stream = io.BufferedReader(SlowDisk(data, args.mbps))
+            start = time.perf_counter()
+            n = sum(1 for _ in bconv.load(stream, fmt, mode='lazy',
+                                          readahead=readahead))
+            elapsed = time.perf_counter() - start
+            print('{:<9} readahead={!s:<5} {:>6} docs {:>8.2f}s {:>8.0f} docs/s'
+                  .format(fmt, readahead, n, elapsed, n/elapsed))
+
+
+def _pubtator(n):
+    # Append random words to each abstract to avoid unrealistically high
+    # compression ratios.
+    rng = random.Random(1)
+    title, abstract, *anno = Path(DATA, 'pubtator', 'tutorial-example.txt')\
+        .read_text(encoding='utf8').strip().split('\n')
+    docs = []
+    for _ in range(n):
+        noise = ' '.join('{:x}'.format(rng.getrandbits(32)) for _ in range(60))
+        docs.append('\n'.join([title, abstract + ' ' + noise, *anno, '']))
+    return '\n'.join(docs).encode('utf8')
+
+
+def _bioc(n):
+    coll = bconv.loads(_pubtator(n).decode('utf8'), 'pubtator')
+    return bconv.dumps(coll, 'bioc_xml')
+
+
+if __name__ == '__main__':
+    main()
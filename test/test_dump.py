@@ -7,18 +7,26 @@ __author__ = "Lenz Furrer"
 
 
 import io
+import gc
+import copy
+import asyncio
 import json
+import weakref
 import tarfile
 import zipfile
 import itertools as it
 from pathlib import Path
-from collections import namedtuple
+from collections import namedtuple, Counter
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 from lxml import etree
 
 import bconv
+from bconv import aio
 from bconv.doc import document
+from bconv.nlp.tokenize import TOKENIZER
+from bconv.util.stream import ropen, decompress
 
 from .utils import DATA, get_cases, xopen
 
@@ -102,6 +110,337 @@ def test_dumps(case):
     _validate(f, case.fmt, case.path)
 
 
+@pytest.mark.parametrize('compression', ['gzip', 'bz2', 'xz', 'zstd'])
+def test_dump_compressed(case, compression, tmp_path):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    # Infer compression from the suffix.
+    suffix = {'gzip': 'gz', 'bz2': 'bz2', 'xz': 'xz', 'zstd': 'zst'}
+    dest = tmp_path / 'out.{}'.format(suffix[compression])
+    bconv.dump(case.coll, dest, case.fmt, **case.options)
+    with ropen(dest, encoding=None, compression=compression) as f:
+        _validate(_decoded(f.read(), case.fmt), case.fmt, case.path)
+    # Compress to an open binary stream.
+    f = io.BytesIO()
+    bconv.dump(case.coll, f, case.fmt, compression, **case.options)
+    f.seek(0)
+    with decompress(f, compression) as d:
+        _validate(_decoded(d.read(), case.fmt), case.fmt, case.path)
+
+
+def test_dump_lazy(case):
+    """Serialise documents from an iterator."""
+    docs = (doc for doc in case.coll)
+    if case.fmt == 'europepmc.zip':
+        # Archive members are named after the collection ID.
+        docs = bconv.LazyCollection(docs, case.coll.id)
+    f = xopen(None, case.fmt)
+    bconv.dump(docs, f, case.fmt, **case.options)
+    f.seek(0)
+    _validate(f, case.fmt, case.path)
+
+
+def test_lazy_collection():
+    """A lazy collection can be iterated once, but not sized or indexed."""
+    expected = bconv.load(DATA / 'pubtator' / 'BC5CDR-example.txt', 'pubtator')
+    coll = bconv.LazyCollection(iter(expected), expected.id)
+    assert repr(coll).startswith('<LazyCollection (single-pass) at 0x')
+    assert coll
+    with pytest.raises(TypeError, match='unsized'):
+        len(coll)
+    with pytest.raises(TypeError, match='single-pass'):
+        coll[0]
+    assert [d.id for d in coll] == [d.id for d in expected]
+    assert not list(coll)
+
+
+@pytest.mark.parametrize('fmt', ['bioc_xml', 'bioc_json', 'txt.json'])
+def test_dump_streaming(fmt, internal):
+    """Documents are released as soon as they are written."""
+    alive = weakref.WeakSet()
+    peak = 0
+
+    def _generate():
+        nonlocal peak
+        for _ in range(20):
+            for doc in internal['BC5CDR-example']:
+                doc = copy.deepcopy(doc)
+                gc.collect()
+                peak = max(peak, len(alive))
+                alive.add(doc)
+                yield doc
+
+    f = xopen(None, fmt)
+    bconv.dump(_generate(), f, fmt)
+    assert peak <= 2
+    f.seek(0)
+    assert len(_decoded_docs(f, fmt)) == 20*len(internal['BC5CDR-example'])
+
+
+@pytest.mark.parametrize('workers', [0, 4])
+@pytest.mark.parametrize('fmt', ['brat', 'bionlp', 'bioc_xml'])
+def test_dump_per_document(fmt, workers, internal, tmp_path):
+    """Write one file per document."""
+    coll = internal['BC5CDR-example']
+    bconv.dump(coll, tmp_path, fmt, per_document=True, workers=workers,
+               compression='gzip')
+    ext = bconv.EXPORTERS[fmt].ext
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        '{}.{}.gz'.format(doc.id, ext) for doc in coll)
+    for doc in coll:
+        path = tmp_path / '{}.{}.gz'.format(doc.id, ext)
+        with ropen(path, encoding=None) as f:
+            expected = bconv.dumps(doc, fmt)
+            if isinstance(expected, str):
+                expected = expected.encode('utf8')
+            assert f.read() == expected
+
+
+@pytest.mark.parametrize('workers', [0, 4])
+def test_dump_per_document_names(workers, tmp_path):
+    """Missing, repeated and path-like IDs get distinct, safe names."""
+    ids = [None, None, 'same', 'same', 'SAME', '../up', 'a/b', '.hidden']
+    docs = []
+    for docid in ids:
+        docs.append(document.Document(docid))
+        docs[-1].add_section('Title', str(docid))
+    bconv.dump(docs, tmp_path / 'out', 'txt', per_document=True,
+               workers=workers)
+    names = sorted(p.name for p in (tmp_path / 'out').iterdir())
+    assert len(names) == len(ids)
+    assert [n for n in names if not n[0].isdigit()] == [
+        'SAME-3.txt', '_._up.txt', '_hidden.txt', 'a_b.txt',
+        'same-2.txt', 'same.txt']
+    assert list(tmp_path.iterdir()) == [tmp_path / 'out']
+
+
+def test_dump_per_document_atomic(internal, tmp_path):
+    """Failed documents leave no partial files."""
+    coll = internal['BC5CDR-example']
+    with pytest.raises(ValueError):
+        bconv.dump(coll, tmp_path, 'pubtator', per_document=True, workers=0,
+                   meta=('missing',))
+    assert list(tmp_path.iterdir()) == []
+    with pytest.raises(ValueError):
+        bconv.dump(coll, io.StringIO(), 'pubtator', per_document=True)
+
+
+@pytest.mark.parametrize('fmt', ['bioc_xml', 'pubtator', 'txt.json'])
+def test_dump_shards(fmt, tmp_path):
+    """Split the output into files of limited size."""
+    source = Path(DATA, 'pubtator', 'NCBIdevset-example.txt')
+    ids = [doc.id for doc in bconv.load(source, 'pubtator')]
+    docs = bconv.load(source, 'pubtator', mode='lazy')
+    paths = bconv.dump(docs, tmp_path / 'docs' / 'part-{:02d}.gz', fmt,
+                       shard_docs=4)
+    assert [p.name for p in paths] == ['part-00.gz', 'part-01.gz',
+                                       'part-02.gz']
+    assert sorted(p.name for p in paths[0].parent.iterdir()) == [
+        p.name for p in paths]
+    shards = [[doc.id for doc in bconv.load(p, fmt)] for p in paths]
+    assert shards == [ids[:4], ids[4:8], ids[8:]]
+
+    limit = 6000
+    docs = bconv.load(source, 'pubtator', mode='lazy')
+    paths = bconv.dump(docs, str(tmp_path / 'sized-{}'), fmt,
+                       shard_bytes=limit)
+    sizes = [p.stat().st_size for p in paths]
+    assert 1 < len(paths) < len(ids)
+    assert all(size >= limit for size in sizes[:-1])
+    assert sum(len(bconv.load(p, fmt)) for p in paths) == len(ids)
+
+    with pytest.raises(ValueError):
+        bconv.dump(docs, tmp_path / 'no-field', fmt, shard_docs=4)
+
+
+def test_dump_many(tmp_path):
+    """Write multiple formats in a single pass."""
+    source = Path(DATA, 'pubtator', 'NCBIdevset-example.txt')
+    outputs = {
+        tmp_path / 'out.xml': 'bioc_xml',
+        tmp_path / 'out.conll': ('conll', {'tagset': 'IOBES'}),
+        tmp_path / 'out.txt': 'pubtator',
+        tmp_path / 'out.ann': 'brat',
+    }
+    for mode in ('native', 'lazy'):
+        bconv.dump_many(bconv.load(source, 'pubtator', mode=mode), outputs)
+        for dest, fmt in outputs.items():
+            fmt, options = (fmt, {}) if isinstance(fmt, str) else fmt
+            ref = tmp_path / 'ref'
+            bconv.dump(bconv.load(source, 'pubtator', mode=mode), ref, fmt,
+                       **options)
+            assert dest.read_bytes() == ref.read_bytes()
+
+    def _failing():
+        yield from it.islice(bconv.load(source, 'pubtator', mode='lazy'), 3)
+        raise RuntimeError('broken input')
+    with pytest.raises(RuntimeError, match='broken input'):
+        bconv.dump_many(_failing(), outputs)
+
+
+def test_dump_many_shared(tmp_path, monkeypatch):
+    """The input is read, tokenised and flattened only once."""
+    source = Path(DATA, 'pubtator', 'NCBIdevset-example.txt')
+    docs = list(bconv.load(source, 'pubtator', mode='lazy'))
+    sentences = [s for doc in docs for s in doc.units('sentence')]
+    calls = Counter()
+
+    class _OneShot:
+        def __iter__(self):
+            calls['iter'] += 1
+            assert calls['iter'] == 1, 'input iterated twice'
+            return iter(docs)
+
+    tokenize = TOKENIZER.tokenize
+    def _tokenize(*args, **kwargs):
+        calls['tokenize'] += 1
+        return tokenize(*args, **kwargs)
+    monkeypatch.setattr(TOKENIZER, 'tokenize', _tokenize)
+
+    flatten = document.Sentence.iter_entities
+    def _flatten(self, split_discontinuous=False, avoid_gaps=None,
+                 avoid_overlaps=None):
+        calls[avoid_gaps, avoid_overlaps] += 1
+        return flatten(self, split_discontinuous, avoid_gaps, avoid_overlaps)
+    monkeypatch.setattr(document.Sentence, 'iter_entities', _flatten)
+
+    outputs = {tmp_path / 'out.xml': 'bioc_xml',
+               tmp_path / 'out.conll': 'conll',  # tokens, keep-longer
+               tmp_path / 'out.txt': 'pubtator',
+               tmp_path / 'out.csv': 'csv'}  # tokens
+    bconv.dump_many(_OneShot(), outputs)
+    assert calls['iter'] == 1
+    assert calls['tokenize'] == len([s for s in sentences if s.text])
+    # Flattened once per strategy, even though pubtator and csv
+    # iterate over entities at different levels.
+    assert calls['split', None] == len(sentences)
+    assert calls['split', 'keep-longer'] == len(sentences)
+
+
+def test_adump(internal, tmp_path):
+    """Dump documents from an async iterator."""
+    coll = internal['BC5CDR-example']
+
+    async def _docs():
+        for doc in coll:
+            await asyncio.sleep(0)
+            yield doc
+
+    dest = tmp_path / 'out.bioc.json'
+    asyncio.run(aio.adump(_docs(), dest))
+    assert dest.read_text(encoding='utf8') == bconv.dumps(coll, 'bioc_json')
+
+
+
+def test_adump_shared_executor(tmp_path):
+    """Load and dump through the same single-worker executor."""
+    source = Path(DATA, 'pubtator', 'NCBIdevset-example.txt')
+    dest = tmp_path / 'out.bioc.json'
+    executor = ThreadPoolExecutor(1)
+
+    async def _main():
+        docs = aio.aload(source, 'pubtator', executor, ahead=2)
+        await asyncio.wait_for(aio.adump(docs, dest, executor=executor), 10)
+
+    try:
+        asyncio.run(_main())
+    finally:
+        executor.shutdown(wait=False)
+    docs = bconv.load(source, 'pubtator', mode='lazy')
+    assert dest.read_text(encoding='utf8') == bconv.dumps(docs, 'bioc_json')
+
+@pytest.mark.parametrize('workers', [0, 2])
+@pytest.mark.parametrize('src_fmt,dest_fmt', [('pubtator', 'bioc_json'),
+                                              ('bioc_xml', 'conll')])
+def test_convert(src_fmt, dest_fmt, workers, tmp_path):
+    """Convert files document by document, optionally in parallel."""
+    for _, path in get_cases([src_fmt]):
+        dest = tmp_path / path.name
+        stats = bconv.convert(path, src_fmt, dest, dest_fmt,
+                              transform=_mark_converted, workers=workers)
+        docs = list(map(_mark_converted, bconv.load(path, src_fmt,
+                                                    mode='lazy')))
+        assert stats.documents == len(docs)
+        assert stats.peak_memory is None or stats.peak_memory > 0
+        assert dest.read_text(encoding='utf8') == bconv.dumps(docs, dest_fmt)
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_convert_dir(workers, tmp_path):
+    """Convert a directory; resume after a crash."""
+    source = Path(DATA, 'pubtator')
+    dest = tmp_path / 'out'
+    paths = sorted(source.glob('*.txt'))
+    stats = bconv.convert_dir(source, 'pubtator', dest, 'bioc_json',
+                              workers=workers, manifest=True,
+                              compression='gzip')
+    assert stats.documents == sum(len(bconv.load(p, 'pubtator'))
+                                  for p in paths)
+    for p in paths:
+        with ropen(dest / '{}.json.gz'.format(p.stem)) as f:
+            docs = list(bconv.load(p, 'pubtator', mode='lazy'))
+            assert f.read() == bconv.dumps(docs, 'bioc_json')
+
+    # Lose one output file.
+    lost = dest / '{}.json.gz'.format(paths[1].stem)
+    lost.unlink()
+    stats = bconv.convert_dir(source, 'pubtator', dest, 'bioc_json',
+                              workers=workers, manifest=True,
+                              compression='gzip')
+    assert stats.documents == len(bconv.load(paths[1], 'pubtator'))
+    assert lost.exists()
+    assert not list(dest.glob('.*.part'))
+
+
+def test_convert_resume(tmp_path):
+    """Skip the shards completed before an interruption."""
+    source = Path(DATA, 'pubtator', 'NCBIdevset-example.txt')
+    dest = tmp_path / 'part-{}.bioc.xml'
+    manifest = tmp_path / 'manifest'
+    ids = [doc.id for doc in bconv.load(source, 'pubtator')]
+
+    def _crashing(doc):
+        if doc.id == ids[5]:
+            raise RuntimeError('crash')
+        return doc
+
+    with pytest.raises(RuntimeError):
+        bconv.convert(source, 'pubtator', dest, transform=_crashing,
+                      shard_docs=2, manifest=manifest)
+    assert sorted(p.name for p in tmp_path.glob('part-*')) == [
+        'part-0.bioc.xml', 'part-1.bioc.xml']
+    stats = bconv.convert(source, 'pubtator', dest, shard_docs=2,
+                          manifest=manifest)
+    assert stats.documents == len(ids) - 4
+    shards = [[d.id for d in bconv.load(tmp_path / 'part-{}.bioc.xml'
+                                        .format(i))]
+              for i in range(5)]
+    assert shards == [ids[i:i+2] for i in range(0, len(ids), 2)]
+
+    with pytest.raises(ValueError, match='different job'):
+        bconv.convert(source, 'pubtator', dest, shard_docs=3,
+                      manifest=manifest)
+
+
+def _mark_converted(doc):
+    doc.metadata['converted'] = 'yes'
+    return doc
+
+
+def _decoded_docs(stream, fmt):
+    if fmt == 'bioc_xml':
+        return _xml_nodes(stream)[3][3:]  # skip source, date, key
+    if fmt == 'bioc_json':
+        return json.load(stream)['documents']
+    return json.load(stream)
+
+
+def _decoded(data, fmt):
+    if not fmt.endswith(('xml', '.zip', '.tgz')):
+        data = data.decode('utf8')
+    return xopen(data, fmt)
+
+
 def _validate(to_test, fmt, path):
     if fmt.endswith('xml'):
         parse = _xml_nodes
@@ -6,15 +6,31 @@ Test bconv.load() and bconv.fetch().
 __author__ = "Lenz Furrer"
 
 
+import bz2
+import sys
+import gzip
+import asyncio
+import lzma
 import json
-import urllib.request
+import random
+import threading
+import subprocess
+import urllib.parse
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 
 import bconv
+import bconv.util.cache
+from bconv import aio
+from bconv.fmt._registry import FormatRegistry
+from bconv.fmt.conll import CoNLLLoader
+from bconv.fmt.pubtator import PubTatorLoader
+from bconv.nlp.tokenize import TOKENIZER
+from lxml import etree
 
-from .utils import DATA, get_cases, path_id, xopen
+from .utils import DATA, get_cases, path_id, xopen, stand_in_server
 
 
 TEXT_ONLY = 'text-only'
@@ -76,16 +92,450 @@ def test_loads(fmt, path, expected):
     _validate(parsed, fmt, expected)
 
 
-@pytest.mark.parametrize('fmt,path', get_cases(bconv.FETCHERS), ids=path_id)
+def _zstd_compress(data):
+    zstandard = pytest.importorskip('zstandard')
+    return zstandard.ZstdCompressor().compress(data)
+
+
+COMPRESSORS = {
+    '.gz': gzip.compress,
+    '.bz2': bz2.compress,
+    '.xz': lzma.compress,
+    '.zst': _zstd_compress,
+}
+
+
+@pytest.mark.parametrize('suffix', list(COMPRESSORS))
+@pytest.mark.parametrize('fmt,path', get_cases(bconv.LOADERS), ids=path_id)
+def test_load_compressed(fmt, path, suffix, expected, tmp_path):
+    """Test loading compressed files."""
+    compressed = tmp_path / (path.name + suffix)
+    compressed.write_bytes(COMPRESSORS[suffix](path.read_bytes()))
+    parsed = bconv.load(compressed, fmt, id=path.stem)
+    _validate(parsed, fmt, expected)
+    # Detect compression from magic bytes.
+    with open(compressed, 'rb') as f:
+        parsed = bconv.load(f, fmt, id=path.stem)
+    _validate(parsed, fmt, expected)
+
+
+@pytest.mark.parametrize('text', ['BZh is plain text.', 'BZh91AY text'])
+def test_load_bz_lookalike(text, tmp_path):
+    """Text resembling a compression signature isn't decompressed."""
+    path = tmp_path / 'lookalike.txt'
+    path.write_text(text, encoding='utf8')
+    assert bconv.load(path, 'txt').text == text
+    with open(path, 'rb') as f:
+        assert bconv.load(f, 'txt').text == text
+
+
+@pytest.mark.parametrize('fmt,path', get_cases(bconv.LOADERS), ids=path_id)
+def test_load_readahead(fmt, path, expected, tmp_path):
+    """Test loading with a background reader thread."""
+    compressed = tmp_path / (path.name + '.gz')
+    compressed.write_bytes(gzip.compress(path.read_bytes()))
+    parsed = bconv.load(compressed, fmt, id=path.stem, readahead=2)
+    _validate(parsed, fmt, expected)
+    docs = bconv.load(compressed, fmt, mode='lazy', readahead=True)
+    assert len(list(docs)) == len(expected[path.stem]['text'])
+
+
+@pytest.mark.parametrize('fmt,path', get_cases(['pxml', 'nxml']),
+                         ids=path_id)
+def test_load_prolog_nodes(fmt, path, expected, tmp_path):
+    """Comments and PIs before the root node don't disturb iterparse."""
+    decl, doctype, rest = path.read_bytes().split(b'\n', 2)
+    prolog = b'<!-- comment --><?pi data?>'
+    modified = tmp_path / path.name
+    modified.write_bytes(b'\n'.join([decl, doctype, prolog, rest]))
+    parsed = bconv.load(modified, fmt, id=path.stem)
+    _validate(parsed, fmt, expected)
+
+
+@pytest.mark.parametrize('fmt,path', get_cases(bconv.LOADERS), ids=path_id)
+def test_load_cached(fmt, path, expected, tmp_path, monkeypatch):
+    """Load unchanged files from the parse cache."""
+    cache = bconv.util.cache.DiskCache(tmp_path / 'cache', compression='gzip')
+    copy = tmp_path / path.name
+    copy.write_bytes(path.read_bytes())
+    for _ in range(2):
+        parsed = bconv.load(copy, fmt, id=path.stem, cache=cache)
+        _validate(parsed, fmt, expected)
+        docs = bconv.load(copy, fmt, mode='lazy', cache=cache)
+        assert len(list(docs)) == len(expected[path.stem]['text'])
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    # Cache hits don't parse.
+    monkeypatch.setattr(bconv.LOADERS[fmt], 'load_one', None)
+    bconv.load(copy, fmt, id=path.stem, cache=cache)
+    assert cache.hits == 3
+    monkeypatch.undo()
+
+    # Other content, options or IDs are different keys.
+    compressed = tmp_path / (path.name + '.gz')
+    compressed.write_bytes(gzip.compress(path.read_bytes()))
+    bconv.load(compressed, fmt, id=path.stem, cache=cache)
+    bconv.load(path, fmt, id='other', cache=cache)
+    assert (cache.hits, cache.misses) == (3, 4)
+
+    # So is the same content under another name.
+    renamed = tmp_path / ('renamed-' + path.name)
+    renamed.write_bytes(path.read_bytes())
+    parsed = list(bconv.load(renamed, fmt, mode='lazy', cache=cache))
+    assert (cache.hits, cache.misses) == (3, 5)
+    uncached = bconv.load(renamed, fmt, mode='lazy')
+    assert [(d.id, d.filename) for d in parsed] == [
+        (d.id, d.filename) for d in uncached]
+
+    # Parallel parsing doesn't change the key.
+    if hasattr(bconv.LOADERS[fmt], '_iter_parallel'):
+        bconv.load(copy, fmt, id=path.stem, cache=cache, readahead=True,
+                   workers=2, chunk_size=1024)
+        assert cache.hits == 4
+
+
+@pytest.mark.parametrize('fmt,path', get_cases(['pubtator', 'conll',
+                                                'bioc_xml']), ids=path_id)
+def test_load_ids(fmt, path, tmp_path):
+    """Load selected documents through an index."""
+    copy = tmp_path / path.name
+    copy.write_bytes(path.read_bytes())
+    docs = list(bconv.load(copy, fmt, mode='lazy'))
+    selected = [docs[-1], docs[0]]
+    ids = [doc.id for doc in selected]
+    index = bconv.index(copy, fmt)
+    assert index.exists()
+
+    loaded = bconv.load(copy, fmt, ids=ids)
+    assert [doc.id for doc in loaded] == ids
+    assert _get_text(loaded) == _get_text(bconv.LazyCollection(selected))
+    # Entities are numbered per document.
+    assert [[e.spans for e in d.iter_entities()] for d in loaded] == \
+        [[e.spans for e in d.iter_entities()] for d in selected]
+
+    coll = bconv.load(copy, fmt, mode='indexed')
+    assert isinstance(coll, bconv.IndexedCollection)
+    assert coll.ids == [doc.id for doc in docs]
+    assert _get_text(coll) == _get_text(bconv.LazyCollection(docs))
+    assert coll.get_document(ids[0]).text == selected[0].text
+    with pytest.raises(KeyError):
+        coll.get_document('missing')
+
+    # An outdated index is rebuilt.
+    copy.write_bytes(path.read_bytes().replace(ids[0].encode(), b'999'))
+    assert bconv.load(copy, fmt, ids=['999'], mode='lazy')
+    with pytest.raises(KeyError):
+        bconv.load(copy, fmt, ids=[ids[0]])
+
+
+def test_load_ids_unsupported(tmp_path):
+    path = Path(DATA, 'bioc_json', 'BC5CDR-example.json')
+    with pytest.raises(ValueError, match='not supported'):
+        bconv.index(path, 'bioc_json')
+    compressed = tmp_path / 'BC5CDR-example.txt.gz'
+    compressed.write_bytes(gzip.compress(
+        Path(DATA, 'pubtator', 'BC5CDR-example.txt').read_bytes()))
+    with pytest.raises(ValueError, match='uncompressed'):
+        bconv.load(compressed, 'pubtator', ids=['1'])
+
+
+@pytest.mark.parametrize('fmt,path',
+                         get_cases(['pubtator', 'pubtator_fbk', 'conll']),
+                         ids=path_id)
+def test_load_slices(fmt, path, tmp_path):
+    """Parsing byte slices (in parallel or mapped) matches streaming."""
+    # Multiple documents and CRLF newlines.
+    data = path.read_bytes().replace(b'\n', b'\r\n')
+    if fmt == 'conll':
+        data = b'# doc_id = 1\r\n' + data + b'# doc_id = 2\r\n\r\n' + data
+    else:
+        data = b' \r\n' + data + b' \r\n\r\n' + data
+    multi = tmp_path / path.name
+    multi.write_bytes(data)
+    streamed = bconv.dumps(bconv.load(multi, fmt), 'bioc_json')
+    for options in (dict(workers=1, chunk_size=100), dict(mmap=True)):
+        sliced = bconv.load(multi, fmt, **options)
+        assert bconv.dumps(sliced, 'bioc_json') == streamed
+    # Empty files cannot be mapped.
+    empty = tmp_path / 'empty'
+    empty.touch()
+    assert not list(bconv.load(empty, fmt, mode='lazy', workers=1))
+    assert not list(bconv.load(empty, fmt, mode='lazy', mmap=True))
+
+
+@pytest.mark.parametrize('fmt,path', get_cases(['pubmed', 'pmc']),
+                         ids=path_id)
 def test_fetch(fmt, path, expected, monkeypatch):
     """Test the fetch function."""
-    def _mock_response(_):
-        return open(path, 'rb')
-    monkeypatch.setattr(urllib.request, 'urlopen', _mock_response)
-    parsed = bconv.fetch('ignored', fmt, id=path.stem)
+    def _respond(_, body):
+        assert b'id=ignored' in body.split(b'&')
+        return 200, {}, path.read_bytes()
+    with stand_in_server(_respond) as url:
+        monkeypatch.setattr(bconv.FETCHERS[fmt], 'url', url)
+        parsed = bconv.fetch('ignored', fmt, id=path.stem)
+    _validate(parsed, fmt, expected)
+
+
+@pytest.mark.parametrize('fmt', ['pubtator', 'pubtator_fbk', 'conll'])
+def test_load_parallel(fmt, tmp_path):
+    """Parse chunks of a file in parallel; compare to serial parsing."""
+    paths = [p for _, p in get_cases([fmt])]
+    if fmt == 'conll':
+        docs = [b'# doc_id = %d\n' % i + p.read_bytes()
+                for i, p in enumerate(paths)]
+    else:
+        docs = [p.read_bytes().strip() + b'\n\n' for p in paths]
+    path = tmp_path / 'docs'
+    path.write_bytes(b''.join(docs * 3))
+    for mode in ('native', 'lazy'):
+        serial = bconv.load(path, fmt, mode=mode)
+        parallel = bconv.load(path, fmt, mode=mode, workers=2, chunk_size=500)
+        assert [bconv.dumps(d, 'bioc_json') for d in parallel] == \
+            [bconv.dumps(d, 'bioc_json') for d in serial]
+
+
+@pytest.mark.parametrize('path', [p for _, p in get_cases(['bioc_xml'])])
+def test_load_bioc_parallel(path):
+    """Parse BioC XML in chunks of documents; compare to serial parsing."""
+    serial = bconv.load(path, 'bioc_xml')
+    parallel = bconv.load(path, 'bioc_xml', workers=2, chunk_size=500)
+    assert parallel.metadata == serial.metadata
+    assert bconv.dumps(parallel, 'bioc_xml') == bconv.dumps(serial, 'bioc_xml')
+    lazy = bconv.load(path, 'bioc_xml', mode='lazy', workers=2,
+                      chunk_size=500)
+    assert [bconv.dumps(d, 'bioc_json') for d in lazy] == \
+        [bconv.dumps(d, 'bioc_json') for d in serial]
+
+
+def _mock_efetch(truncate_first=False):
+    """Create a responder serving the PubMed example articles."""
+    path = DATA / 'pubmed' / 'NCBIdevset-example.pxml'
+    articles = {a.findtext('.//PMID'): etree.tostring(a)
+                for a in etree.parse(str(path)).iterfind('PubmedArticle')}
+    lock = threading.Lock()
+    state = dict(active=0, max_active=0, requests=[])
+
+    def _respond(_, body):
+        ids = urllib.parse.parse_qs(body.decode())['id'][0].split(',')
+        with lock:
+            state['requests'].append(ids)
+            state['active'] += 1
+            state['max_active'] = max(state['active'], state['max_active'])
+            first = len(state['requests']) == 1
+        threading.Event().wait(.05)
+        with lock:
+            state['active'] -= 1
+        payload = b''.join(articles[i] for i in reversed(ids))
+        payload = b'<PubmedArticleSet>' + payload + b'</PubmedArticleSet>'
+        if first and truncate_first:
+            payload = payload[:len(payload)//2]
+        return 200, {}, payload
+
+    docids = list(articles)
+    random.Random(4).shuffle(docids)
+    return _respond, docids, state
+
+
+def test_fetch_batches(monkeypatch):
+    """Fetch concurrent batches from a mock efetch server."""
+    respond, docids, state = _mock_efetch(truncate_first=True)
+    with stand_in_server(respond) as url:
+        monkeypatch.setattr(bconv.FETCHERS['pubmed'], 'url', url)
+        docs = bconv.fetch(docids, 'pubmed', mode='lazy',
+                           batch_size=3, workers=3, rate=100)
+        assert [doc.id for doc in docs] == docids
+    # One retry for the truncated response.
+    assert len(state['requests']) == -(-len(docids) // 3) + 1
+    assert state['max_active'] > 1
+
+
+def test_aload_afetch(monkeypatch):
+    """Load and fetch asynchronously without blocking the event loop."""
+    respond, docids, state = _mock_efetch()
+    path = DATA / 'bioc_xml' / 'NCBIdevset-example.xml'
+
+    async def _main():
+        ticks = 0
+
+        async def _tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(.001)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(_tick())
+        executor = ThreadPoolExecutor(2)
+        fetched = [doc async for doc in aio.afetch(
+            docids, 'pubmed', executor, ahead=2,
+            batch_size=3, workers=3, rate=100)]
+        loaded = [doc async for doc in aio.aload(path, 'bioc_xml', executor)]
+        ticker.cancel()
+        executor.shutdown()
+        return fetched, loaded, ticks
+
+    with stand_in_server(respond) as url:
+        monkeypatch.setattr(bconv.FETCHERS['pubmed'], 'url', url)
+        fetched, loaded, ticks = asyncio.run(_main())
+    assert [doc.id for doc in fetched] == docids
+    assert state['max_active'] > 1
+    assert [doc.id for doc in loaded] == \
+        [doc.id for doc in bconv.load(path, 'bioc_xml', mode='lazy')]
+    assert ticks > 0
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_fetch_cached(compression, monkeypatch, tmp_path):
+    """Only request IDs missing from the cache."""
+    respond, docids, state = _mock_efetch()
+    cache = bconv.util.cache.DiskCache(tmp_path, compression=compression)
+    options = dict(batch_size=2, rate=100, cache=cache)
+    with stand_in_server(respond) as url:
+        monkeypatch.setattr(bconv.FETCHERS['pubmed'], 'url', url)
+        uncached = bconv.fetch(docids, 'pubmed', rate=100)
+        assert cache.hits == 0
+        bconv.fetch(docids[::3], 'pubmed', **options)
+        state['requests'].clear()
+        cached = bconv.fetch(docids, 'pubmed', **options)
+    assert [doc.id for doc in cached] == docids
+    assert bconv.dumps(cached, 'bioc_json') == \
+        bconv.dumps(uncached, 'bioc_json')
+    assert sorted(i for ids in state['requests'] for i in ids) == \
+        sorted(set(docids) - set(docids[::3]))
+    assert cache.hits == len(docids[::3])
+
+
+@pytest.mark.parametrize('fmt', ['pubtator', 'biocxml'])
+def test_fetch_pubtator(fmt, monkeypatch, tmp_path):
+    """Fetch from a stand-in PubTator Central server."""
+    if fmt == 'pubtator':
+        path = DATA / 'pubtator' / 'NCBIdevset-example.txt'
+        records = {l.split('|')[0]: l + '\n\n'
+                   for l in path.read_text('utf8').split('\n\n') if l}
+        head, tail = '', ''
+    else:
+        path = DATA / 'bioc_xml' / 'NCBIdevset-example.xml'
+        root = etree.parse(str(path)).getroot()
+        records = {d.findtext('id'): etree.tostring(d).decode()
+                   for d in root.iterfind('document')}
+        head, tail = '<collection>', '</collection>'
+    requests = []
+
+    def _respond(handler, _):
+        endpoint, query = handler.path.split('?')
+        assert endpoint.endswith('/' + fmt)
+        ids = urllib.parse.parse_qs(query)['pmids'][0].split(',')
+        requests.append(ids)
+        payload = head + ''.join(records[i] for i in reversed(ids)) + tail
+        return 200, {}, payload.encode('utf8')
+
+    expected = {doc.id: bconv.dumps(doc, 'bioc_json')
+                for doc in bconv.load(path, fmt.replace('bioc', 'bioc_'),
+                                      mode='lazy')}
+    docids = list(records)
+    random.Random(7).shuffle(docids)
+    fetcher = bconv.FETCHERS['pubtator']
+    with stand_in_server(_respond) as url:
+        monkeypatch.setattr(fetcher, 'url', url + '/export/{}')
+        for cache in (None, tmp_path, tmp_path):
+            docs = bconv.fetch(docids, 'pubtator', mode='lazy', format=fmt,
+                               batch_size=4, rate=100, cache=cache)
+            assert [bconv.dumps(d, 'bioc_json') for d in docs] == \
+                [expected[i] for i in docids]
+    # The second fetch fills the cache, the third doesn't send requests.
+    assert len(requests) == 2 * 3
+
+    # Malformed responses aren't requested again.
+    del requests[:]
+    head = '<collection><document>' if fmt == 'biocxml' else 'x|t|y\nz'
+    with stand_in_server(_respond) as url:
+        monkeypatch.setattr(fetcher, 'url', url + '/export/{}')
+        with pytest.raises((ValueError, etree.XMLSyntaxError)):
+            list(bconv.fetch(docids[:2], 'pubtator', mode='lazy',
+                             format=fmt, rate=100))
+    assert len(requests) == 1
+
+
+@pytest.mark.parametrize('fmt,path', get_cases(['pubtator', 'bioc_xml']),
+                         ids=path_id)
+def test_load_url(fmt, path, expected):
+    """Test loading from a URL with gzip transfer encoding."""
+    def _respond(handler, _):
+        if 'gzip' in handler.headers['Accept-Encoding']:
+            return 200, {'Content-Encoding': 'gzip'}, \
+                gzip.compress(path.read_bytes())
+        return 200, {}, path.read_bytes()
+    with stand_in_server(_respond) as url:
+        parsed = bconv.load('{}/{}'.format(url, path.name), fmt, id=path.stem)
     _validate(parsed, fmt, expected)
 
 
+@pytest.mark.parametrize('processes', [0, 2])
+def test_load_dir(processes, tmp_path, monkeypatch):
+    """Load all files in a directory in parallel."""
+    cases = [(fmt, path) for fmt, path in get_cases(['pxml', 'nxml', 'conll'])
+             if path.suffix == '.' + fmt]  # format can be inferred
+    for i, (_, path) in enumerate(cases):
+        target = tmp_path / 'sub' / '{:02}-{}'.format(i, path.name)
+        target.parent.mkdir(exist_ok=True)
+        target.write_bytes(gzip.compress(path.read_bytes()))
+        target.rename(target.with_name(target.name + '.gz'))
+    expected = [(bconv.dumps(d, 'bioc_json'), '{:02}-{}'.format(i, p.stem))
+                for i, (fmt, p) in enumerate(cases)
+                for d in bconv.load(p, fmt, mode='lazy')]
+    docs = bconv.load_dir(tmp_path, pattern='**/*', processes=processes)
+    assert [(bconv.dumps(d, 'bioc_json'), d.filename) for d in docs] == \
+        expected
+    docs = bconv.load_dir(tmp_path / 'sub', processes=processes,
+                          ordered=False)
+    assert sorted(d.filename for d in docs) == sorted(f for _, f in expected)
+
+    # The loader's own `workers` option is passed through.
+    calls = []
+
+    def _iter_parallel(loader, *_, **__):
+        calls.append(loader.workers)
+        return iter(())
+    monkeypatch.setattr(CoNLLLoader, '_iter_parallel', _iter_parallel)
+    source = DATA / 'conll'
+    assert not list(bconv.load_dir(source, 'conll', processes=0, workers=3))
+    assert calls == [3] * len(list(source.iterdir()))
+
+
+def test_load_dir_index(tmp_path):
+    """Index files and hidden files are not loaded."""
+    source = DATA / 'conll'
+    for path in source.iterdir():
+        (tmp_path / path.name).write_bytes(path.read_bytes())
+    bconv.index(tmp_path / 'BC5CDR-example.conll')
+    (tmp_path / '.tutorial-example.conll.1-2.part').write_bytes(b'# doc')
+    expected = [d.id for d in bconv.load_dir(source, processes=0)]
+    for fmt in (None, 'conll'):
+        docs = bconv.load_dir(tmp_path, fmt, processes=0)
+        assert [d.id for d in docs] == expected
+    stats = bconv.convert_dir(tmp_path, None, tmp_path / 'out', 'bioc_json',
+                              workers=0)
+    assert stats.documents == len(expected)
+
+
+@pytest.mark.parametrize('thread_local', [False, True])
+def test_load_threaded(thread_local, monkeypatch):
+    """Load concurrently with fresh tokenizers; compare to serial loading."""
+    cases = get_cases(['txt', 'pubtator', 'bioc_xml', 'pxml']) * 8
+
+    def _load(case):
+        fmt, path = case
+        parsed = bconv.load(path, fmt, id=path.stem)
+        return _get_text(parsed), _get_entities(parsed)
+
+    monkeypatch.setattr(TOKENIZER, 'thread_local', thread_local)
+    serial = [_load(case) for case in cases]
+    # Reset the tokenizer, so that the threads race for initialisation.
+    monkeypatch.setattr(TOKENIZER, '_shared', type(TOKENIZER._shared)())
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        parallel = list(executor.map(_load, cases))
+    assert parallel == serial
+
+
 def _validate(parsed, fmt, expected):
     restrictions = set(RESTRICTIONS.get(fmt, ()))
     restrictions.update(RESTRICTIONS.get(parsed.id, ()))
@@ -179,3 +629,56 @@ def _rel_subj_obj(relations):
             rel,
             members=[[refid, role] for (refid, _), role in members]
         )
+
+
+@pytest.mark.parametrize('name,fmt', [
+    ('coll.bioc.xml.gz', 'bioc_xml'),
+    ('coll.BIOC.JSON.XZ', 'bioc_json'),
+    ('docs.txt.bz2', 'txt'),
+    ('docs.conll.zst', 'conll'),
+])
+def test_guess_format_compressed(name, fmt):
+    """Infer the format behind a compression suffix."""
+    assert bconv.fmt._guess_format(name, bconv.LOADERS) == fmt
+
+
+def test_format_registry(monkeypatch, tmp_path):
+    """Resolve format classes lazily, including entry points."""
+    (tmp_path / 'fakefmt.py').write_text(
+        'from bconv.fmt.pubtator import PubTatorLoader\n'
+        'class FakeLoader(PubTatorLoader):\n'
+        '    pass\n')
+    dist = tmp_path / 'fakefmt-1.0.dist-info'
+    dist.mkdir()
+    (dist / 'METADATA').write_text(
+        'Metadata-Version: 2.1\nName: fakefmt\nVersion: 1.0\n')
+    (dist / 'entry_points.txt').write_text(
+        '[bconv.loaders]\n'
+        'fake = fakefmt:FakeLoader\n'
+        'pubtator = fakefmt:FakeLoader\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    loaders = FormatRegistry('bconv.loaders', {
+        'pubtator': '.pubtator:PubTatorLoader'})
+    assert loaders['pubtator'] is PubTatorLoader  # built-in takes precedence
+    assert 'fake' in loaders
+    assert sorted(loaders) == ['fake', 'pubtator']
+    monkeypatch.setattr(bconv.fmt, 'LOADERS', loaders)
+    path = DATA / 'pubtator' / 'NCBIdevset-example.txt'
+    coll = bconv.load(path, 'fake')
+    assert bconv.dumps(coll, 'bioc_json') == \
+        bconv.dumps(bconv.load(path, 'pubtator'), 'bioc_json')
+    with pytest.raises(KeyError):
+        loaders['unknown']
+
+
+def test_import_lazily():
+    """Importing bconv doesn't import the format modules."""
+    modules = ['lxml', 'tarfile', 'zipfile', 'csv', 'urllib.request',
+               'bconv.fmt.bioc', 'bconv.fmt.pubtator']
+    script = ('import sys, bconv; '
+              'print([m for m in {!r} if m in sys.modules])'.format(modules))
+    output = subprocess.run([sys.executable, '-c', script], check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True,
+                            cwd=str(Path(bconv.__file__).parent.parent))
+    assert output.stdout.strip() == '[]'
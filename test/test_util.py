@@ -0,0 +1,245 @@
+"""
+Test utility functions.
+"""
+
+
+__author__ = "Lenz Furrer"
+
+
+import os
+import gzip
+import time
+import socket
+import itertools as it
+import urllib.error
+
+import pytest
+
+from bconv.util import misc, iterate
+from bconv.util.http import Session, RateLimiter
+from bconv.util.cache import DiskCache
+from bconv.util.manifest import Manifest
+
+from .utils import stand_in_server
+
+
+TEXTS = [
+    '',
+    'plain ASCII text',
+    'Ähnliche Fälle mit α-Synuclein',
+    'astral \U0001F9EC plane\U0001F52C',
+    'é',
+]
+
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_codepoint_indices_utf8(text):
+    """Compare the UTF-8 shortcut to the generic implementation."""
+    expected = list(misc.iter_codepoint_indices(text, 'utf-8'))
+    assert misc.codepoint_indices(text, 'utf8') == expected
+
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_byte_indices_utf8(text):
+    """Compare the UTF-8 shortcut to the generic implementation."""
+    expected = list(misc.iter_byte_indices(text, 'utf-8'))
+    assert misc.codepoint_indices(text, 'utf8', text2bytes=False) == expected
+
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_sparse_indices(text):
+    """Compare the sparse sequences to the dense implementation."""
+    assert list(misc.SparseCodepointIndices(text)) == \
+        list(misc.iter_codepoint_indices(text, 'utf-8'))
+    assert list(misc.SparseByteIndices(text)) == \
+        list(misc.iter_byte_indices(text, 'utf-8'))
+    assert misc.SparseByteIndices(text)[-1] == len(text)
+
+
+@pytest.mark.parametrize('codec', [
+    'latin-1', 'ascii', 'cp1252', 'utf-16', 'utf-16-le', 'utf-16-be',
+    'utf-32', 'utf-32-be', 'utf-8-sig', 'shift_jis', 'gb18030', 'utf-7',
+    'iso2022_jp'])
+@pytest.mark.parametrize('text', TEXTS + ['日本語 a日b'])
+def test_codepoint_indices_codecs(text, codec):
+    """Compare the fast paths to character-wise encoding."""
+    try:
+        expected = list(misc.iter_codepoint_indices(text, codec))
+    except UnicodeEncodeError:
+        with pytest.raises(UnicodeEncodeError):
+            misc.codepoint_indices(text, codec)
+        return
+    assert misc.codepoint_indices(text, codec) == expected
+    expected = list(misc.iter_byte_indices(text, codec))
+    assert misc.codepoint_indices(text, codec, text2bytes=False) == expected
+
+
+def _scripted(*responses):
+    """Respond with the given statuses in turn; log the client ports."""
+    responses = list(responses)
+    clients = []
+
+    def _respond(handler, _):
+        clients.append(handler.client_address[1])
+        status = responses.pop(0) if responses else 200
+        headers = {'Retry-After': '0'} if status == 429 else {}
+        if status == 302:
+            headers['Location'] = '/target'
+        return status, headers, b'path: ' + handler.path.encode()
+    return _respond, clients
+
+
+def test_session_keep_alive():
+    """Consecutive requests reuse one connection."""
+    respond, clients = _scripted()
+    with stand_in_server(respond) as url, Session() as session:
+        for _ in range(5):
+            with session.get(url + '/x') as f:
+                assert f.read() == b'path: /x'
+    assert len(clients) == 5
+    assert len(set(clients)) == 1
+
+
+def test_session_retry():
+    """Transient errors are retried, permanent ones are not."""
+    respond, clients = _scripted(503, 429, 500, 200, 404)
+    with stand_in_server(respond) as url, Session(backoff=0) as session:
+        with session.post(url, {'id': '1,2'}) as f:
+            assert f.read() == b'path: /'
+        assert len(clients) == 3 + 1
+        with pytest.raises(urllib.error.HTTPError) as e:
+            session.get(url)
+        assert e.value.code == 404
+        assert len(clients) == 4 + 1
+    respond, clients = _scripted(*[503]*5)
+    with stand_in_server(respond) as url, Session(retries=2, backoff=0) as s:
+        with pytest.raises(urllib.error.HTTPError) as e:
+            s.get(url)
+        assert e.value.code == 503
+        assert len(clients) == 3
+
+
+def test_session_redirect_gzip():
+    """Redirects are followed and gzip bodies are decompressed."""
+    def _respond(handler, _):
+        if handler.path != '/target':
+            return 302, {'Location': '/target'}, b''
+        return 200, {'Content-Encoding': 'gzip'}, gzip.compress(b'payload')
+    with stand_in_server(_respond) as url, Session() as session:
+        with session.post(url + '/source', b'data') as f:
+            assert f.read() == b'payload'
+
+
+def test_session_connection_error():
+    """Unreachable servers raise URLError after retrying."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    with pytest.raises(urllib.error.URLError):
+        Session(retries=1, backoff=0).get('http://127.0.0.1:{}'.format(port))
+
+
+def test_rate_limiter():
+    """Events are spaced out evenly."""
+    limiter = RateLimiter(50)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.wait()
+    assert time.monotonic() - start >= 5/50
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip', 'xz'])
+def test_disk_cache(compression, tmp_path):
+    """Store, expire and evict records."""
+    cache = DiskCache(tmp_path, compression=compression)
+    assert cache.get('db/1') is None
+    cache.put('db/1', b'one')
+    cache.put('db/../2', b'two')
+    assert 'db/1' in cache
+    assert cache.get('db/1') == b'one'
+    assert cache.get('db/../2') == b'two'
+    assert all(tmp_path in p.parents for p in tmp_path.rglob('*'))
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    # Expire records by their modification time.
+    path = cache._path('db/1')
+    os.utime(str(path), (time.time(), time.time() - 100))
+    assert DiskCache(tmp_path, ttl=10, compression=compression) \
+        .get('db/1') is None
+    DiskCache(tmp_path, ttl=10).evict()
+    assert not path.exists()
+
+    # Evict the least recently used records.
+    cache = DiskCache(tmp_path)
+    cache.clear()
+    for i in range(5):
+        cache.put(str(i), bytes(500))
+        os.utime(str(cache._path(str(i))), (i, i))
+    cache = DiskCache(tmp_path, max_size=2000)
+    cache.get('0')
+    cache.evict()
+    assert sorted(p.name for p in tmp_path.glob('?')) == ['0', '2', '3', '4']
+
+
+def test_manifest(tmp_path):
+    """Record completed units and verify their output."""
+    path = tmp_path / 'job' / 'manifest'
+    manifest = Manifest(path, job={'fmt': ('a', 'b')})
+    for key in ('x', 'y'):
+        output = tmp_path / '{}.out'.format(key)
+        output.write_text(key)
+        manifest.record(key, output, documents=1, range=(0, 1))
+    manifest = Manifest(path, job={'fmt': ['a', 'b']})
+    assert manifest.completed('x', range=[0, 1])['documents'] == 1
+    assert manifest.completed('x', range=[0, 2]) is None
+    assert manifest.completed('z') is None
+    (tmp_path / 'y.out').write_text('changed')
+    assert manifest.completed('y') is None
+
+    # An interrupted record is dropped.
+    with open(str(path), 'a') as f:
+        f.write('{"key": "z", "outp')
+    manifest = Manifest(path, job={'fmt': ['a', 'b']})
+    assert sorted(manifest.units) == ['x', 'y']
+    manifest.record('z', tmp_path / 'x.out')
+    assert manifest.completed('z') is not None
+    assert len(Manifest(path, job={'fmt': ['a', 'b']}).units) == 3
+
+    with pytest.raises(ValueError, match='different job'):
+        Manifest(path, job={'fmt': ['a', 'c']})
+
+
+def test_iter_ahead():
+    assert list(iterate.iter_ahead(range(100), depth=3)) == list(range(100))
+
+    def _failing():
+        yield 1
+        raise ValueError('broken input')
+    items = iterate.iter_ahead(_failing(), depth=3)
+    assert next(items) == 1
+    with pytest.raises(ValueError, match='broken input'):
+        next(items)
+
+    # Stopping early doesn't exhaust the source.
+    source = iter(range(1000))
+    items = iterate.iter_ahead(source, depth=3)
+    assert next(items) == 0
+    items.close()
+    assert next(source) < 10
+
+
+def test_fan_out():
+    def _total(items):
+        return sum(items)
+
+    def _first(items):
+        return next(items)
+    results = iterate.fan_out(range(100), [_total, list, _first], depth=2)
+    assert results == [sum(range(100)), list(range(100)), 0]
+
+    def _failing(items):
+        for i in items:
+            if i == 5:
+                raise ValueError('broken consumer')
+    with pytest.raises(ValueError, match='broken consumer'):
+        iterate.fan_out(it.count(), [list, _failing], depth=2)
@@ -7,7 +7,10 @@ __author__ = "Lenz Furrer"
 
 
 import io
+import threading
 from pathlib import Path
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 
 DATA = Path(__file__).parent / 'data'
@@ -36,3 +39,44 @@ def xopen(source, fmt):
         else:
             f = io.StringIO(source)
     return f
+
+
+@contextmanager
+def stand_in_server(respond):
+    """
+    Run a local HTTP server in a background thread.
+
+    For each request, respond(handler, body) is called,
+    which must return a triple <status, headers, payload>.
+    The context value is the server's base URL.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive
+
+        def do_GET(self):
+            self._respond(b'')
+
+        def do_POST(self):
+            self._respond(self.rfile.read(int(self.headers['Content-Length'])))
+
+        def _respond(self, body):
+            status, headers, payload = respond(self, body)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *_):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True,
+                              kwargs=dict(poll_interval=.01))
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:{}'.format(server.server_port)
+    finally:
+        server.shutdown()
+        server.server_close()